@@ -0,0 +1,325 @@
+"""Stand-in for a Plugwise Adam, serving recorded domain objects over HTTP.
+
+The fake gateway answers the requests of the adam component like an Adam
+does: full and incremental (modified since) domain objects, the appliances,
+and the commands, which are applied to its copy of the domain objects.
+
+The benchmark drives it through a few extra endpoints, which are not counted
+in its statistics:
+
+    POST /bench/tick?fraction=0.2   change the measurements of a fraction of
+                                    the objects, like time passing
+    GET  /bench/stats               requests served and bytes sent
+    POST /bench/reset               reset the statistics
+
+Run it on its own to point a Home Assistant at it:
+
+    python -m benchmarks.gateway --port 8080 benchmarks/fixtures/adam.xml
+
+or to serve a generated site of about 200 devices (see benchmarks.topology):
+
+    python -m benchmarks.gateway --port 8080 --devices 200
+"""
+
+import argparse
+import gzip
+import json
+import random
+import re
+import sys
+import threading
+import xml.etree.ElementTree as Etree
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from benchmarks import topology
+
+FIXTURE = Path(__file__).parent / "fixtures" / "adam.xml"
+
+DOMAIN_OBJECTS = re.compile(r"^/core/domain_objects(?:;modified_date:ge:(.+))?$")
+APPLIANCES = "/core/appliances"
+SETPOINT = re.compile(r"^/core/locations;id=(\w+)/thermostat(?:;id=\w+)?$")
+LOCATION = re.compile(r"^/core/locations;id=(\w+)$")
+RULE = re.compile(r"^/core/rules;id=(\w+)$")
+RELAY = re.compile(r"^/core/appliances;id=(\w+)/relay$")
+
+# Log types changed by a tick, with the largest step of a change
+TICK_LOGS = {
+    "temperature": 0.4,
+    "outdoor_temperature": 0.3,
+    "boiler_temperature": 3.0,
+    "central_heater_water_pressure": 0.05,
+    "battery": 0.01,
+    "illuminance": 20.0,
+    "electricity_consumed": 25.0,
+}
+
+
+class FakeAdam:
+    """The domain objects of a fake gateway."""
+
+    def __init__(self, document, seed=0):
+        """Load the domain objects from an XML document."""
+        root = Etree.fromstring(document)
+        self._objects = {}
+        for element in root:
+            if element.get("id") is not None:
+                self._objects[element.get("id")] = element
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._now = max(
+            (_date(element.findtext("modified_date"))
+             for element in self._objects.values()
+             if element.findtext("modified_date")),
+            default=datetime.now().astimezone())
+
+    def domain_objects(self, since=None):
+        """Return the objects modified since a date, or all objects."""
+        since = _date(since) if since else None
+        with self._lock:
+            return self._document("domain_objects", [
+                obj_id for obj_id, element in self._objects.items()
+                if since is None or (element.findtext("modified_date")
+                                     and _date(element.findtext(
+                                         "modified_date")) >= since)])
+
+    def appliances(self):
+        """Return the appliances."""
+        with self._lock:
+            return self._document("appliances", [
+                obj_id for obj_id, element in self._objects.items()
+                if element.tag == "appliance"])
+
+    def command(self, path, body):
+        """Apply a command, return False if the path is not known."""
+        with self._lock:
+            try:
+                command = Etree.fromstring(body)
+            except Etree.ParseError:
+                return False
+            match = SETPOINT.match(path)
+            if match:
+                return self._set(match.group(1), (
+                    "actuator_functionalities/thermostat_functionality/"
+                    "setpoint"), command.findtext("setpoint"))
+            match = LOCATION.match(path)
+            if match:
+                return self._set(match.group(1), "preset",
+                                 command.findtext("location/preset"))
+            match = RULE.match(path)
+            if match:
+                return self._set(match.group(1), "active",
+                                 command.findtext("rule/active"))
+            match = RELAY.match(path)
+            if match:
+                return self._set(match.group(1), (
+                    "actuator_functionalities/relay_functionality/state"),
+                                 command.findtext("state"))
+            return False
+
+    def tick(self, fraction):
+        """Change the measurements of a fraction of the objects."""
+        with self._lock:
+            changed = 0
+            for obj_id, element in self._objects.items():
+                if self._random.random() >= fraction:
+                    continue
+                touched = False
+                for log in element.iterfind("logs/point_log"):
+                    step = TICK_LOGS.get(log.findtext("type"))
+                    measurement = log.find("period/measurement")
+                    if step is None or measurement is None:
+                        continue
+                    try:
+                        value = float(measurement.text)
+                    except (TypeError, ValueError):
+                        continue
+                    value = max(0.0, value + self._random.uniform(-step, step))
+                    measurement.text = "{:.2f}".format(value)
+                    touched = True
+                if touched:
+                    self._touch(obj_id)
+                    changed += 1
+            return changed
+
+    def _set(self, obj_id, path, value):
+        """Set a field of an object, return False if it has no such field."""
+        element = self._objects.get(obj_id)
+        field = element.find(path) if element is not None else None
+        if field is None or value is None:
+            return False
+        field.text = value
+        self._touch(obj_id)
+        return True
+
+    def _touch(self, obj_id):
+        """Mark an object modified now."""
+        self._now += timedelta(seconds=1)
+        element = self._objects[obj_id]
+        modified = element.find("modified_date")
+        if modified is None:
+            modified = Etree.SubElement(element, "modified_date")
+        modified.text = self._now.isoformat(timespec="milliseconds")
+        self._cache.pop(obj_id, None)
+
+    def _document(self, tag, obj_ids):
+        """Return a document of objects."""
+        parts = [b"<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n<",
+                 tag.encode(), b">\n"]
+        for obj_id in obj_ids:
+            body = self._cache.get(obj_id)
+            if body is None:
+                body = Etree.tostring(self._objects[obj_id])
+                self._cache[obj_id] = body
+            parts.append(body)
+        parts.append(b"</" + tag.encode() + b">\n")
+        return b"".join(parts)
+
+
+class FakeAdamServer(ThreadingHTTPServer):
+    """HTTP server of a fake gateway, counting what it serves."""
+
+    daemon_threads = True
+
+    def __init__(self, address, adam):
+        """Set up the server of a fake gateway."""
+        super().__init__(address, FakeAdamHandler)
+        self.adam = adam
+        self.stats_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset the statistics."""
+        with self.stats_lock:
+            self.stats = {"requests": 0, "bytes": 0, "full": 0,
+                          "incremental": 0, "commands": 0}
+
+    def count(self, kind, size):
+        """Count a request and the bytes of its response."""
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += size
+            if kind is not None:
+                self.stats[kind] += 1
+
+
+class FakeAdamHandler(BaseHTTPRequestHandler):
+    """Handler of the requests to a fake gateway."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written apart, don't wait for the delayed ack
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        """Serve the domain objects, appliances, ping and statistics."""
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        if path == "/bench/stats":
+            with self.server.stats_lock:
+                body = json.dumps(self.server.stats).encode()
+            self._send(200, body, "application/json", count=False)
+            return
+        if path == "/ping":
+            self._send(200, b"")
+            return
+        if path == APPLIANCES:
+            self._send(200, self.server.adam.appliances(), kind="full")
+            return
+        match = DOMAIN_OBJECTS.match(path)
+        if match:
+            since = match.group(1)
+            try:
+                body = self.server.adam.domain_objects(since)
+            except ValueError:
+                self._send(400, b"")
+                return
+            self._send(200, body, kind="incremental" if since else "full")
+            return
+        self._send(404, b"")
+
+    def do_PUT(self):
+        """Apply a command."""
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.server.adam.command(unquote(urlsplit(self.path).path), body):
+            self._send(200, b"", kind="commands")
+        else:
+            self._send(404, b"")
+
+    def do_POST(self):
+        """Tick or reset the statistics."""
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        url = urlsplit(self.path)
+        if url.path == "/bench/tick":
+            fraction = float(parse_qs(url.query).get("fraction", ["0.2"])[0])
+            changed = self.server.adam.tick(fraction)
+            body = json.dumps({"changed": changed}).encode()
+            self._send(200, body, "application/json", count=False)
+        elif url.path == "/bench/reset":
+            self.server.reset()
+            self._send(200, b"", count=False)
+        else:
+            self._send(404, b"", count=False)
+
+    def _send(self, status, body, content_type="text/xml", kind=None,
+              count=True):
+        """Send a response, compressed when the client accepts it."""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if body and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=5)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if count:
+            self.server.count(kind, len(body))
+
+    def log_message(self, format, *args):
+        """Don't log every request."""
+
+
+def serve(document, port=0, host="127.0.0.1"):
+    """Start a fake gateway in a thread and return its server."""
+    server = FakeAdamServer((host, port), FakeAdam(document))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _date(value):
+    """Parse a modified_date of the gateway."""
+    return datetime.fromisoformat(value)
+
+
+def main(argv=None):
+    """Serve a fake gateway until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("fixture", nargs="?", default=str(FIXTURE),
+                        help="domain objects XML to serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0,
+                        help="port to listen on, 0 for any free port")
+    parser.add_argument("--devices", type=int,
+                        help="serve a generated site of about this many "
+                        "devices instead of the fixture")
+    args = parser.parse_args(argv)
+
+    if args.devices is not None:
+        document = topology.sized(args.devices)
+    else:
+        document = Path(args.fixture).read_bytes()
+    server = FakeAdamServer((args.host, args.port), FakeAdam(document))
+    # The benchmark reads the port from the first line
+    print("port", server.server_address[1], flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
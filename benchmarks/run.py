@@ -0,0 +1,318 @@
+"""End-to-end benchmark of the adam component against a fake gateway.
+
+Sets up the component with all its platforms in a Home Assistant instance,
+pointed at a fake gateway (benchmarks.gateway) in a separate process, and
+refreshes it a number of times while the gateway changes part of its
+measurements between the refreshes. Reported are:
+
+    cold start       time, CPU time, requests, bytes and state writes of the
+                     setup of the component and its platforms
+    refresh          latency (median, 95th percentile and max), CPU time per
+                     entity, requests, bytes and state writes per refresh
+
+The results are stored in benchmarks/results/<commit>.json, so they can be
+compared between commits:
+
+    python -m benchmarks.run
+    python -m benchmarks.run --compare benchmarks/results/1234abc.json
+
+With --devices the fake gateway serves generated sites (benchmarks.topology)
+instead of the fixture, one run per size, to see how the component scales:
+
+    python -m benchmarks.run --devices 10 100 1000
+
+Needs Home Assistant (of the version the component supports) and requests,
+no network.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.request import Request, urlopen
+
+from homeassistant.core import HomeAssistant
+from homeassistant.setup import async_setup_component
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS = Path(__file__).resolve().parent / "results"
+FIXTURE = Path(__file__).resolve().parent / "fixtures" / "adam.xml"
+
+DOMAIN = "adam"
+DATA_ADAM = "adam_data"
+PLATFORMS = ("climate", "sensor", "switch", "water_heater")
+
+# Metric: description, unit, scale of the value for display
+METRICS = {
+    "entities": ("entities", "", 1),
+    "cold_start": ("cold start", "ms", 1e3),
+    "cold_start_cpu": ("cold start CPU", "ms", 1e3),
+    "cold_start_requests": ("cold start requests", "", 1),
+    "cold_start_bytes": ("cold start bytes", "kB", 1e-3),
+    "cold_start_writes": ("cold start state writes", "", 1),
+    "refresh_median": ("refresh latency median", "ms", 1e3),
+    "refresh_p95": ("refresh latency p95", "ms", 1e3),
+    "refresh_max": ("refresh latency max", "ms", 1e3),
+    "refresh_cpu_per_entity": ("refresh CPU per entity", "us", 1e6),
+    "refresh_requests": ("requests per refresh", "", 1),
+    "refresh_bytes": ("bytes per refresh", "kB", 1e-3),
+    "refresh_writes": ("state writes per refresh", "", 1),
+}
+# Columns of the results per size: metric, label
+SCALE_COLUMNS = (
+    ("entities", "entities"),
+    ("cold_start", "cold start ms"),
+    ("refresh_median", "refresh ms"),
+    ("refresh_cpu_per_entity", "CPU/entity us"),
+    ("refresh_bytes", "kB/refresh"),
+    ("refresh_writes", "writes/refresh"),
+)
+
+
+class FakeGateway:
+    """A fake gateway in a separate process, so its CPU time isn't counted."""
+
+    def __init__(self, fixture, devices=None):
+        """Start the fake gateway, serving a fixture or a generated site."""
+        command = [sys.executable, "-m", "benchmarks.gateway", str(fixture)]
+        if devices is not None:
+            command += ["--devices", str(devices)]
+        self._process = subprocess.Popen(
+            command, cwd=str(ROOT), stdout=subprocess.PIPE,
+            universal_newlines=True)
+        self.port = int(self._process.stdout.readline().split()[1])
+
+    def stats(self):
+        """Return the requests served and bytes sent."""
+        return self._call("GET", "/bench/stats")
+
+    def tick(self, fraction):
+        """Change the measurements of a fraction of the objects."""
+        return self._call("POST", "/bench/tick?fraction={}".format(fraction))
+
+    def stop(self):
+        """Stop the fake gateway."""
+        self._process.terminate()
+        self._process.wait()
+
+    def _call(self, method, path):
+        """Call a benchmark endpoint of the fake gateway."""
+        request = Request("http://127.0.0.1:{}{}".format(self.port, path),
+                          method=method, data=b"" if method == "POST" else None)
+        with urlopen(request) as response:
+            return json.loads(response.read() or b"{}")
+
+
+class Counter:
+    """Count the state writes of a Home Assistant instance."""
+
+    def __init__(self, hass):
+        """Wrap the state machine of the instance."""
+        self.writes = 0
+        async_set = hass.states.async_set
+
+        def counting_async_set(*args, **kwargs):
+            self.writes += 1
+            return async_set(*args, **kwargs)
+
+        hass.states.async_set = counting_async_set
+
+
+def _difference(after, before):
+    """Return the difference of two gateway statistics."""
+    return {key: after[key] - before[key] for key in after}
+
+
+async def _benchmark(gateway, refreshes, fraction, config_dir):
+    """Set up the component, refresh it and return the measurements."""
+    hass = HomeAssistant()
+    hass.config.config_dir = config_dir
+    hass.config.skip_pip = True
+    counter = Counter(hass)
+    config = {
+        DOMAIN: {
+            "host": "127.0.0.1",
+            "port": gateway.port,
+            "password": "benchmark",
+            # The benchmark refreshes, not the timer
+            "scan_interval": 3600,
+        }
+    }
+    results = {}
+
+    before = gateway.stats()
+    started, cpu = time.perf_counter(), time.process_time()
+    if not await async_setup_component(hass, DOMAIN, config):
+        raise RuntimeError("Setup of the component failed")
+    await hass.async_block_till_done()
+    results["cold_start"] = time.perf_counter() - started
+    results["cold_start_cpu"] = time.process_time() - cpu
+    stats = _difference(gateway.stats(), before)
+    results["cold_start_requests"] = stats["requests"]
+    results["cold_start_bytes"] = stats["bytes"]
+    results["cold_start_writes"] = counter.writes
+
+    entities = [entity_id for entity_id in hass.states.async_entity_ids()
+                if entity_id.split(".")[0] in PLATFORMS]
+    results["entities"] = len(entities)
+    hub = next(iter(hass.data[DATA_ADAM].values()))
+
+    latencies = []
+    cpu_time = 0
+    writes = 0
+    before = gateway.stats()
+    for _ in range(refreshes):
+        gateway.tick(fraction)
+        written = counter.writes
+        started, cpu = time.perf_counter(), time.process_time()
+        await hub.async_refresh()
+        await hass.async_block_till_done()
+        latencies.append(time.perf_counter() - started)
+        cpu_time += time.process_time() - cpu
+        writes += counter.writes - written
+    stats = _difference(gateway.stats(), before)
+
+    latencies.sort()
+    results["refresh_median"] = statistics.median(latencies)
+    results["refresh_p95"] = latencies[int(0.95 * (len(latencies) - 1))]
+    results["refresh_max"] = latencies[-1]
+    results["refresh_cpu_per_entity"] = (
+        cpu_time / refreshes / max(1, len(entities)))
+    results["refresh_requests"] = stats["requests"] / refreshes
+    results["refresh_bytes"] = stats["bytes"] / refreshes
+    results["refresh_writes"] = writes / refreshes
+
+    await hass.async_stop()
+    return results
+
+
+def run(fixture=FIXTURE, refreshes=30, fraction=0.2, devices=None):
+    """Run the benchmark against a fake gateway.
+
+    The gateway serves the fixture, or a generated site of about a number of
+    devices.
+    """
+    gateway = FakeGateway(fixture, devices)
+    try:
+        with tempfile.TemporaryDirectory() as config_dir:
+            os.symlink(ROOT / "custom_components",
+                       os.path.join(config_dir, "custom_components"))
+            sys.path.insert(0, config_dir)
+            try:
+                return asyncio.run(
+                    _benchmark(gateway, refreshes, fraction, config_dir))
+            finally:
+                sys.path.remove(config_dir)
+    finally:
+        gateway.stop()
+
+
+def _commit():
+    """Return the current commit, marked when the tree has changes."""
+    def git(*args):
+        return subprocess.run(
+            ("git",) + args, cwd=str(ROOT), stdout=subprocess.PIPE,
+            universal_newlines=True, check=True).stdout.strip()
+
+    try:
+        commit = git("rev-parse", "--short", "HEAD")
+        if git("status", "--porcelain", "--untracked-files=no"):
+            commit += "-dirty"
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return commit
+
+
+def _report(results, baseline=None):
+    """Print the results, next to the baseline when given."""
+    for key, (description, unit, scale) in METRICS.items():
+        value = results[key] * scale
+        line = "{:<28} {:>10.1f} {:<3}".format(description, value, unit)
+        if baseline is not None and key in baseline:
+            reference = baseline[key] * scale
+            line += " {:>10.1f} {:<3}".format(reference, unit)
+            if reference:
+                line += " {:>+7.1f}%".format(
+                    100 * (value - reference) / reference)
+        print(line)
+
+
+def _report_scale(results, baseline=None):
+    """Print the results per size, with the change from the baseline."""
+    print("{:>8}".format("devices") + "".join(
+        " {:>16}".format(label) for _, label in SCALE_COLUMNS))
+    for devices, sized in results.items():
+        line = "{:>8}".format(devices)
+        reference = (baseline or {}).get(str(devices), {})
+        for key, _ in SCALE_COLUMNS:
+            cell = "{:.1f}".format(sized[key] * METRICS[key][2])
+            if reference.get(key):
+                cell += " {:+.0f}%".format(
+                    100 * (sized[key] - reference[key]) / reference[key])
+            line += " {:>16}".format(cell)
+        print(line)
+
+
+def main(argv=None):
+    """Run the benchmark, store and report its results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixture", default=str(FIXTURE),
+                        help="domain objects XML served by the fake gateway")
+    parser.add_argument("--refreshes", type=int, default=30)
+    parser.add_argument("--fraction", type=float, default=0.2,
+                        help="fraction of the objects changed per refresh")
+    parser.add_argument("--compare", metavar="RESULTS",
+                        help="results of an earlier run to compare with")
+    parser.add_argument("--devices", type=int, nargs="+", metavar="N",
+                        help="run against generated sites of about N devices "
+                        "instead of the fixture")
+    parser.add_argument("--output", metavar="RESULTS",
+                        help="file to store the results in, by default "
+                        "benchmarks/results/<commit>.json")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    commit = _commit()
+    if args.devices:
+        results = {}
+        for devices in args.devices:
+            results[devices] = run(Path(args.fixture), args.refreshes,
+                                   args.fraction, devices)
+        fixture = "generated"
+        name = commit + "-scale.json"
+    else:
+        results = run(Path(args.fixture), args.refreshes, args.fraction)
+        fixture = Path(args.fixture).name
+        name = commit + ".json"
+
+    output = Path(args.output) if args.output else RESULTS / name
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "fixture": fixture,
+        "refreshes": args.refreshes,
+        "fraction": args.fraction,
+        "results": results,
+    }, indent=2) + "\n")
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())["results"]
+    if args.devices:
+        _report_scale(results, baseline)
+    else:
+        _report(results, baseline)
+    print("Results stored in", output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
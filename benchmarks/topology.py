@@ -0,0 +1,291 @@
+"""Generator of the domain objects of an Adam of any size.
+
+Builds a valid domain objects document with a boiler, a number of zones with
+a Lisa each, TRVs spread over the zones and plugs, with logs like those of a
+real Adam: the logs the component reads and the ones it skips. Serve it with
+the fake gateway to benchmark large sites:
+
+    python -m benchmarks.topology --locations 40 --trvs 120 --plugs 100 \\
+        > /tmp/adam-large.xml
+    python -m benchmarks.run --fixture /tmp/adam-large.xml
+"""
+
+import argparse
+import random
+import sys
+import xml.etree.ElementTree as Etree
+from datetime import datetime, timedelta, timezone
+
+SCHEDULE_TEMPLATE = "zone_preset_based_on_time_and_presence_with_override"
+PRESET_TEMPLATE = "zone_setpoint_and_state_based_on_preset"
+PRESETS = {"home": 21.0, "away": 16.0, "asleep": 17.0, "vacation": 15.0,
+           "no_frost": 10.0}
+ZONE_TYPES = ("livingroom", "kitchen", "bedroom", "bathroom", "study",
+              "hallway", "attic")
+PLUG_TYPES = ("refrigerator", "washingmachine", "dishwasher", "dryer",
+              "game_console", "tv", "computer_desktop", "lamp", "heater_electric")
+EPOCH = datetime(2020, 3, 1, 10, 0, tzinfo=timezone(timedelta(hours=1)))
+
+
+class _Generator:
+    """Build the objects of one document."""
+
+    def __init__(self, seed):
+        """Set up a generator, the same seed gives the same document."""
+        self._random = random.Random(seed)
+        self.root = Etree.Element("domain_objects")
+
+    def id(self):
+        """Return a new object id."""
+        return "{:032x}".format(self._random.getrandbits(128))
+
+    def date(self, spread=3600):
+        """Return a modified date, up to spread seconds before the epoch."""
+        date = EPOCH - timedelta(seconds=self._random.uniform(0, spread))
+        return date.isoformat(timespec="milliseconds")
+
+    def uniform(self, low, high):
+        """Return a random value."""
+        return self._random.uniform(low, high)
+
+    def choice(self, values):
+        """Return a random value."""
+        return self._random.choice(values)
+
+    def object(self, kind, name, object_type=None, obj_id=None, **attrib):
+        """Add a top-level object of a kind (appliance, location, ...)."""
+        element = Etree.SubElement(
+            self.root, kind, id=obj_id or self.id(), **attrib)
+        _text(element, "name", name)
+        _text(element, "description", "")
+        if object_type is not None:
+            _text(element, "type", object_type)
+        _text(element, "created_date", self.date(3600 * 24 * 365))
+        _text(element, "modified_date", self.date())
+        _text(element, "deleted_date", "")
+        return element
+
+    def log(self, logs, kind, log_type, unit, values, interval="PT15M"):
+        """Add a log with one measurement, or one per tariff."""
+        date = self.date()
+        log = Etree.SubElement(logs, kind, id=self.id())
+        _text(log, "updated_date", date)
+        _text(log, "type", log_type)
+        _text(log, "unit", unit)
+        _text(log, "last_consecutive_log_date", date)
+        _text(log, "interval", interval)
+        period = Etree.SubElement(
+            log, "period", start_date=date, end_date=date)
+        if isinstance(values, dict):
+            for tariff, value in values.items():
+                _text(period, "measurement", value, log_date=date,
+                      tariff=tariff)
+        else:
+            _text(period, "measurement", values, log_date=date)
+
+    def functionality(self, parent, tag, functionality_type, setpoint):
+        """Add a thermostat functionality."""
+        functionality = Etree.SubElement(parent, tag, id=self.id())
+        _text(functionality, "updated_date", self.date())
+        _text(functionality, "type", functionality_type)
+        _text(functionality, "lower_bound", "0")
+        _text(functionality, "upper_bound", "30")
+        _text(functionality, "resolution", "0.01")
+        _text(functionality, "setpoint", "{:.2f}".format(setpoint))
+        return functionality
+
+
+def _text(parent, tag, text, **attrib):
+    """Add an element with text."""
+    element = Etree.SubElement(parent, tag, **attrib)
+    element.text = text
+    return element
+
+
+def _value(value):
+    """Format a measurement."""
+    return "{:.2f}".format(value)
+
+
+def generate(locations=3, trvs=4, plugs=3, seed=0):
+    """Return a domain objects document with a boiler, zones, TRVs and plugs.
+
+    Each zone has a Lisa, the TRVs are spread over the zones.
+    """
+    gen = _Generator(seed)
+
+    gateway = gen.object("gateway", "Adam")
+    _text(gateway, "vendor_name", "Plugwise")
+    _text(gateway, "vendor_model", "smile_open_therm")
+    _text(gateway, "firmware_version", "3.0.15")
+
+    boiler = gen.object("appliance", "OpenTherm", "heater_central")
+    logs = Etree.SubElement(boiler, "logs")
+    gen.log(logs, "point_log", "boiler_temperature", "C",
+            _value(gen.uniform(30, 60)), "PT5M")
+    gen.log(logs, "point_log", "central_heater_water_pressure", "bar",
+            _value(gen.uniform(1.2, 2.0)), "PT5M")
+    gen.log(logs, "point_log", "central_heating_state", "", "on", "")
+    gen.log(logs, "point_log", "boiler_state", "", "on", "")
+    gen.log(logs, "point_log", "domestic_hot_water_state", "", "off", "")
+    gen.log(logs, "point_log", "modulation_level", "",
+            _value(gen.uniform(0, 1)), "PT5M")
+    gen.log(logs, "point_log", "return_water_temperature", "C",
+            _value(gen.uniform(25, 45)), "PT5M")
+    gen.log(logs, "cumulative_log", "gas_consumed", "m3",
+            _value(gen.uniform(1000, 5000)), "PT1H")
+    actuators = Etree.SubElement(boiler, "actuator_functionalities")
+    gen.functionality(actuators, "thermostat_functionality",
+                      "maximum_boiler_temperature", 70)
+
+    zones = []
+    for number in range(locations):
+        zones.append((gen.id(), gen.id(), "Zone {}".format(number + 1),
+                      gen.choice(ZONE_TYPES), []))
+
+    building = gen.object("location", "Home", "building")
+    _text(building, "preset", "")
+    appliances = Etree.SubElement(building, "appliances")
+    Etree.SubElement(appliances, "appliance", id=boiler.get("id"))
+    logs = Etree.SubElement(building, "logs")
+    gen.log(logs, "point_log", "outdoor_temperature", "C",
+            _value(gen.uniform(-5, 20)), "PT1H")
+    Etree.SubElement(building, "actuator_functionalities")
+
+    for loc_id, lisa_id, name, _, members in zones:
+        lisa = gen.object("appliance", "Lisa " + name, "zone_thermostat",
+                          lisa_id)
+        _text(lisa, "location", None, id=loc_id)
+        logs = Etree.SubElement(lisa, "logs")
+        gen.log(logs, "point_log", "temperature", "C",
+                _value(gen.uniform(16, 23)))
+        gen.log(logs, "point_log", "battery", "",
+                _value(gen.uniform(0.2, 1)), "PT1H")
+        gen.log(logs, "point_log", "illuminance", "lx",
+                _value(gen.uniform(0, 400)))
+        gen.log(logs, "point_log", "thermostat", "C", _value(20))
+        members.append(lisa_id)
+
+    for number in range(trvs):
+        loc_id, _, name, _, members = zones[number % len(zones)] if zones \
+            else (None, None, "", None, [])
+        trv = gen.object("appliance", "Tom {} {}".format(name, number + 1),
+                         "thermostatic_radiator_valve")
+        if loc_id is not None:
+            _text(trv, "location", None, id=loc_id)
+        logs = Etree.SubElement(trv, "logs")
+        gen.log(logs, "point_log", "temperature", "C",
+                _value(gen.uniform(15, 24)))
+        gen.log(logs, "point_log", "battery", "",
+                _value(gen.uniform(0.2, 1)), "PT1H")
+        gen.log(logs, "point_log", "valve_position", "",
+                _value(gen.uniform(0, 1)))
+        actuators = Etree.SubElement(trv, "actuator_functionalities")
+        gen.functionality(actuators, "thermostat_functionality",
+                          "thermostat", 18)
+        members.append(trv.get("id"))
+
+    for number in range(plugs):
+        plug = gen.object("appliance", "Plug {}".format(number + 1),
+                          gen.choice(PLUG_TYPES))
+        logs = Etree.SubElement(plug, "logs")
+        power = gen.uniform(0, 250)
+        gen.log(logs, "point_log", "electricity_consumed", "W",
+                {"nl_peak": _value(power), "nl_offpeak": _value(0)}, "")
+        gen.log(logs, "point_log", "electricity_produced", "W",
+                {"nl_peak": _value(0), "nl_offpeak": _value(0)}, "")
+        gen.log(logs, "interval_log", "electricity_consumed", "Wh",
+                {"nl_peak": _value(power), "nl_offpeak": _value(0)}, "PT1H")
+        gen.log(logs, "interval_log", "electricity_produced", "Wh",
+                {"nl_peak": _value(0), "nl_offpeak": _value(0)}, "PT1H")
+        gen.log(logs, "cumulative_log", "electricity_consumed", "Wh",
+                {"nl_peak": _value(gen.uniform(0, 500000)),
+                 "nl_offpeak": _value(gen.uniform(0, 300000))}, "PT1H")
+        gen.log(logs, "point_log", "relay", "", "on", "")
+        actuators = Etree.SubElement(plug, "actuator_functionalities")
+        relay = Etree.SubElement(
+            actuators, "relay_functionality", id=gen.id())
+        _text(relay, "updated_date", gen.date())
+        _text(relay, "lock", "false")
+        _text(relay, "state", gen.choice(("on", "off")))
+
+    for loc_id, _, name, zone_type, members in zones:
+        location = gen.object("location", name, zone_type, loc_id)
+        _text(location, "preset", gen.choice(tuple(PRESETS)))
+        appliances = Etree.SubElement(location, "appliances")
+        for appl_id in members:
+            Etree.SubElement(appliances, "appliance", id=appl_id)
+        logs = Etree.SubElement(location, "logs")
+        gen.log(logs, "point_log", "temperature", "C",
+                _value(gen.uniform(16, 23)))
+        gen.log(logs, "point_log", "thermostat", "C", _value(20))
+        actuators = Etree.SubElement(location, "actuator_functionalities")
+        gen.functionality(actuators, "thermostat_functionality",
+                          "thermostat", gen.uniform(16, 22))
+
+    schedule_id = gen.id()
+    preset_id = gen.id()
+    for template_id, tag, name in ((schedule_id, SCHEDULE_TEMPLATE, "Schedule"),
+                                   (preset_id, PRESET_TEMPLATE, "Presets")):
+        template = gen.object("template", name, tag=tag, obj_id=template_id)
+        template.remove(template.find("deleted_date"))
+
+    for loc_id, _, name, _, _ in zones:
+        for schedule, active in (("Werkdagen", "true"), ("Weekend", "false")):
+            rule = gen.object("rule", "{} {}".format(schedule, name))
+            Etree.SubElement(rule, "template", id=schedule_id,
+                             tag=SCHEDULE_TEMPLATE)
+            _text(rule, "active", active)
+            directives = Etree.SubElement(rule, "directives")
+            for time, preset in (("[mo 07:00,mo 08:30)", "home"),
+                                 ("[mo 08:30,mo 17:00)", "away"),
+                                 ("[mo 17:00,mo 23:00)", "home"),
+                                 ("[mo 23:00,tu 07:00)", "asleep")):
+                when = Etree.SubElement(directives, "when", time=time)
+                Etree.SubElement(when, "then", preset=preset)
+            zone = Etree.SubElement(Etree.SubElement(
+                Etree.SubElement(rule, "contexts"), "context"), "zone")
+            Etree.SubElement(zone, "location", id=loc_id)
+
+    rule = gen.object("rule", "Presets")
+    Etree.SubElement(rule, "template", id=preset_id, tag=PRESET_TEMPLATE)
+    _text(rule, "active", "true")
+    directives = Etree.SubElement(rule, "directives")
+    for preset, setpoint in PRESETS.items():
+        when = Etree.SubElement(directives, "when", preset=preset)
+        Etree.SubElement(when, "then", icon=preset, setpoint=_value(setpoint),
+                         state="on")
+    zone = Etree.SubElement(Etree.SubElement(
+        Etree.SubElement(rule, "contexts"), "context"), "zone")
+    for loc_id, _, _, _, _ in zones:
+        Etree.SubElement(zone, "location", id=loc_id)
+
+    return Etree.tostring(gen.root, encoding="UTF-8")
+
+
+def sized(devices, seed=0):
+    """Return a document of about a number of devices, in the proportions
+    of a large site: a zone per 8 devices, 3 TRVs per zone and plugs.
+    """
+    locations = max(1, devices // 8)
+    trvs = min(3 * locations, max(0, devices - locations) // 2)
+    plugs = max(0, devices - locations - trvs)
+    return generate(locations, trvs, plugs, seed)
+
+
+def main(argv=None):
+    """Write a generated document to stdout."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--locations", type=int, default=3,
+                        help="zones, each with a Lisa")
+    parser.add_argument("--trvs", type=int, default=4,
+                        help="TRVs, spread over the zones")
+    parser.add_argument("--plugs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    sys.stdout.buffer.write(
+        generate(args.locations, args.trvs, args.plugs, args.seed))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
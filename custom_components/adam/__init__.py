@@ -1,31 +1,45 @@
 """Plugwise Adam component for Home Assistant Core."""
 
+import asyncio
 import logging
+import random
+import threading
+import time
 
 import voluptuous as vol
-import plugwise
 
+from collections import Counter, namedtuple
 from datetime import timedelta
 from homeassistant.helpers import discovery
 from homeassistant.helpers.entity import Entity
-from homeassistant.helpers.event import track_time_interval
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.service import async_extract_entities
+from homeassistant.helpers.storage import Store
 from homeassistant.core import callback
 from homeassistant.helpers.dispatcher import (
-    async_dispatcher_connect, dispatcher_send)
+    async_dispatcher_connect, async_dispatcher_send)
 from homeassistant.helpers import config_validation as cv
-from homeassistant.util import Throttle
+from homeassistant.util import Throttle, slugify
+import homeassistant.util.dt as dt_util
 
 from homeassistant.const import (
+    ATTR_TEMPERATURE,
     CONF_HOST,
     CONF_NAME,
     CONF_PASSWORD,
     CONF_PORT,
     CONF_SCAN_INTERVAL,
     CONF_USERNAME,
+    EVENT_HOMEASSISTANT_STOP,
 )
 
 from homeassistant.exceptions import PlatformNotReady
 
+from .gateway import CONTROLLER_TYPE, POOL_SIZE, PwGateway, close_sessions
+from .columns import PwColumns, slots
+from .history import PwRingBuffer, history_size
+from .profiler import PwProfiler
+
 _LOGGER = logging.getLogger(__name__)
 
 # Default directives
@@ -36,123 +50,1018 @@ DEFAULT_MIN_TEMP = 4
 DEFAULT_MAX_TEMP = 30
 DOMAIN = 'adam'
 DATA_ADAM = "adam_data"
-SIGNAL_UPDATE_ADAM = "adam_update"
+SIGNAL_UPDATE_ADAM = "adam_update_{}"
+SIGNAL_DIAGNOSTICS_ADAM = "adam_diagnostics_{}"
 SCAN_INTERVAL = timedelta(seconds=30)
+# Window in which repeated commands to a device are collapsed, in seconds
+COMMAND_DELAY = 1
+# Devices sent commands at once, as many as the connections kept per gateway
+COMMAND_CONCURRENCY = POOL_SIZE
+
+# Adaptive polling: poll fast for a while after a command or a change of the
+# hvac states, and around the schedule transitions seen earlier. Back off
+# when nothing changed for a number of refreshes.
+FAST_SCAN_INTERVAL = timedelta(seconds=10)
+FAST_SCAN_PERIOD = timedelta(minutes=2)
+STABLE_REFRESHES = 10
+TRANSITION_WINDOW = 2
+MAX_TRANSITIONS = 96
+HVAC_STATES = ('central_heating_state', 'boiler_state', 'dhw_state')
+
+# Fields of each device the hub reads itself, whatever the entities read
+HUB_FIELDS = frozenset(
+    ('type', 'setpoint_temp', 'selected_schedule') + HVAC_STATES)
+
+# Unreachable gateways: retry with a jittered exponential backoff, and after
+# a number of failed refreshes stop polling (the entities become unavailable)
+# and only probe the gateway until it answers again.
+FAILURES_BEFORE_OPEN = 3
+BACKOFF_MIN = timedelta(seconds=15)
+BACKOFF_MAX = timedelta(minutes=10)
+
+# State write suppression of the sensors
+CONF_DEADBAND = "deadband"
+CONF_MAX_AGE = "max_age"
+DEFAULT_MAX_AGE = timedelta(minutes=10)
+
+# The topology and last snapshot of each hub are stored, so after a restart
+# the entities are set up from them while the first refresh runs. They are
+# saved at most once per SAVE_DELAY, in seconds.
+STORAGE_VERSION = 1
+STORAGE_KEY = "adam.{}"
+SAVE_DELAY = 60
+
+# Diagnostic sensors of the refreshes of each hub
+CONF_DIAGNOSTICS = "diagnostics"
+
+# Profile service: profile the next refreshes or commands of the hubs
+SERVICE_PROFILE = "profile"
+ATTR_COUNT = "count"
+DEFAULT_PROFILE_COUNT = 5
+PROFILE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_NAME): cv.string,
+        vol.Optional(ATTR_COUNT, default=DEFAULT_PROFILE_COUNT): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=100)),
+    }
+)
+
+# Bulk set service: set the relays, setpoints, presets or schedules of many
+# entities, with a single refresh per hub
+SERVICE_BULK_SET = "bulk_set"
+ATTR_RELAY = "relay"
+ATTR_PRESET_MODE = "preset_mode"
+ATTR_SCHEDULE = "schedule"
+BULK_SET_SCHEMA = vol.All(
+    cv.make_entity_service_schema(
+        {
+            vol.Optional(ATTR_RELAY): cv.boolean,
+            vol.Optional(ATTR_TEMPERATURE): vol.Coerce(float),
+            vol.Optional(ATTR_PRESET_MODE): cv.string,
+            vol.Optional(ATTR_SCHEDULE): cv.boolean,
+        }
+    ),
+    cv.has_at_least_one_key(
+        ATTR_RELAY, ATTR_TEMPERATURE, ATTR_PRESET_MODE, ATTR_SCHEDULE),
+)
 
 # Read configuration
-#ADAM_CONFIG = vol.Schema(
-#        {
-#            vol.Optional(CONF_NAME, default=DEFAULT_NAME): cv.string,
-#            vol.Required(CONF_PASSWORD): cv.string,
-#            vol.Required(CONF_HOST): cv.string,
-#            vol.Optional(CONF_PORT, default=DEFAULT_PORT): cv.port,
-#            vol.Optional(CONF_USERNAME, default=DEFAULT_USERNAME): cv.string,
-#        }
-#)
-
-# Read platform configuration
+ADAM_CONFIG = vol.Schema(
+    {
+        vol.Optional(CONF_NAME, default=DEFAULT_NAME): cv.string,
+        vol.Required(CONF_PASSWORD): cv.string,
+        vol.Required(CONF_HOST): cv.string,
+        vol.Optional(CONF_PORT, default=DEFAULT_PORT): cv.port,
+        vol.Optional(CONF_USERNAME, default=DEFAULT_USERNAME): cv.string,
+        vol.Optional(CONF_SCAN_INTERVAL, default=SCAN_INTERVAL): cv.time_period,
+        vol.Optional(CONF_DEADBAND, default={}): vol.Schema(
+            {cv.string: vol.Coerce(float)}),
+        vol.Optional(CONF_MAX_AGE, default=DEFAULT_MAX_AGE): cv.time_period,
+        vol.Optional(CONF_DIAGNOSTICS, default=False): cv.boolean,
+    }
+)
+
+
+def _unique_names(adams):
+    """Validate the Adams have unique names."""
+    names = [adam[CONF_NAME] for adam in adams]
+    if len(names) != len(set(names)):
+        raise vol.Invalid("Each Adam needs a unique name")
+    return adams
+
+
+# Read platform configuration, a single Adam or a list of Adams
 CONFIG_SCHEMA = vol.Schema(
     {
-        DOMAIN: vol.Schema(
-            {
-                vol.Optional(CONF_NAME, default=DEFAULT_NAME): cv.string,
-                vol.Required(CONF_PASSWORD): cv.string,
-                vol.Required(CONF_HOST): cv.string,
-                vol.Optional(CONF_PORT, default=DEFAULT_PORT): cv.port,
-                vol.Optional(CONF_USERNAME, default=DEFAULT_USERNAME): cv.string,
-                vol.Optional(CONF_SCAN_INTERVAL, default=SCAN_INTERVAL): cv.time_period,
-#                vol.Optional(CONF_ADAM): vol.All(
-#                    cv.ensure_list,
-#                    [
-#                        vol.All(
-#                            cv.ensure_list, [ADAM_CONFIG],
-#                        ),
-#                    ],
-            }
-#                )
-#            }
-        )
+        DOMAIN: vol.All(cv.ensure_list, [ADAM_CONFIG], _unique_names),
     },
     extra=vol.ALLOW_EXTRA,
 )
 
-def setup(hass, config):
-    """Set up the Plugwise (Anna) Thermostat."""
-    conf = config.get(DOMAIN)
-    scan_interval = conf.get(CONF_SCAN_INTERVAL)
+async def async_setup(hass, config):
+    """Set up the Plugwise Adams."""
+    adams = config.get(DOMAIN)
 
-    if conf is None:
+    if adams is None:
         raise PlatformNotReady
 
-    _LOGGER.info('Plugwise %s',conf)
+    _LOGGER.info('Plugwise %s', adams)
     hass.data[DATA_ADAM] = {}
 
-#    if CONF_ADAM in conf:
-#        adams = conf[CONF_ADAM]
+    # With several Adams, the entities are prefixed with the name of their Adam
+    namespace = len(adams) > 1
+    hubs = await asyncio.gather(
+        *[_async_setup_hub(hass, conf, namespace) for conf in adams])
+    hubs = [hub for hub in hubs if hub is not None]
+    if not hubs:
+        return False
+
+    async def async_close_sessions(event):
+        """Close the HTTP sessions to the Adams."""
+        await hass.async_add_executor_job(close_sessions)
 
-#    _LOGGER.info('Adams %s', adams)
-#    hass.data[DOMAIN] = {}
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_close_sessions)
 
-#        for adam in adams:
-#            _LOGGER.info('Adam %s', adam)
-#            adam_config=adam[0]
+    async def async_profile(call):
+        """Profile the next refreshes or commands of the Adams."""
+        name = call.data.get(CONF_NAME)
+        await asyncio.gather(*[hub.async_profile(call.data[ATTR_COUNT])
+                               for hub in hubs if name in (None, hub.name)])
 
-    adam = plugwise.Plugwise(
+    hass.services.async_register(
+        DOMAIN, SERVICE_PROFILE, async_profile, schema=PROFILE_SCHEMA)
+
+    async def async_bulk_set(call):
+        """Set the relays, setpoints, presets or schedules of entities."""
+        entities = [entity for hub in hubs
+                    for entity in hub.entities.values()]
+        for entity in await async_extract_entities(hass, entities, call):
+            entity.async_bulk_set(call.data)
+        await asyncio.gather(*[hub.async_send_commands() for hub in hubs])
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_BULK_SET, async_bulk_set, schema=BULK_SET_SCHEMA)
+
+    for hub in hubs:
+        hass.data[DATA_ADAM][hub.name] = hub
+        hub.async_start()
+        for platform in ('climate', 'sensor', 'switch', 'water_heater'):
+            hass.async_create_task(discovery.async_load_platform(
+                hass, platform, DOMAIN, {CONF_NAME: hub.name}, config))
+
+    _LOGGER.info('Config %s', hass.data[DATA_ADAM])
+    return True
+
+
+async def _async_setup_hub(hass, conf, namespace):
+    """Connect to an Adam and discover its devices.
+
+    When the devices were stored before, the hub is set up from them without
+    waiting for the Adam.
+    """
+    adam = PwGateway(
             conf[CONF_USERNAME],
             conf[CONF_PASSWORD],
             conf[CONF_HOST],
             conf[CONF_PORT],
     )
 
+    hub = PwHub(hass, adam, conf, namespace)
+    if await hub.async_restore():
+        return hub
+
     try:
-        adam.ping_gateway()
+        await hass.async_add_executor_job(adam.ping_gateway)
     except OSError:
-        _LOGGER.debug("Ping failed, retrying later", exc_info=True)
-        raise PlatformNotReady
+        _LOGGER.error("Unable to reach Adam %s", conf[CONF_NAME], exc_info=True)
+        return None
+
+    # Call the Plugwise API once, the platforms are set up from this data
+    try:
+        await hass.async_add_executor_job(hub.discover)
+    except (OSError, RuntimeError):
+        _LOGGER.error("Unable to get location info from Adam %s", hub.name)
+        return None
+    hub.async_save()
+    return hub
+
+
+class PwHub:
+    """Representation of an Adam gateway, refreshing its data for all platforms.
+
+    The hub is the only place where the gateway is polled. Each refresh
+    produces a new read-only snapshot of the data of all devices, keyed on
+    (dev_id, ctrl_id, plug_id), in columns (PwColumns) with a row per
+    device. The entities read their row of the latest snapshot.
+
+    Until the first sync with the gateway (synced), the topology and
+    snapshot can be the ones stored before the restart.
 
-    hass.data[DATA_ADAM] = PwHub(adam)
+    When the fingerprint of the gateway devices changes, the topology is
+    discovered again: the platforms (add_platform) add the entities of the
+    new devices, those of the removed devices are removed.
+    """
 
-    def adam_refresh(event_time):
-        """Call Adam to refresh information."""
+    def __init__(self, hass, api, conf, namespace=False):
+        """Initialize the hub."""
+        self.hass = hass
+        self.api = api
+        self.name = conf[CONF_NAME]
+        self.namespace = namespace
+        self.scan_interval = conf[CONF_SCAN_INTERVAL]
+        self.deadband = conf[CONF_DEADBAND]
+        self.max_age = conf[CONF_MAX_AGE]
+        self.diagnostics = conf[CONF_DIAGNOSTICS]
+        self.stats = PwStats()
+        self._set_topology(PwTopology(None, (), ()))
+        self._fingerprint = None
+        self._platforms = []
+        self._platforms_lock = threading.Lock()
+        self.history = {}
+        self.entities = {}
+        self._consumers = {}
+        self._consumed = Counter()
+        self._projection = None
+        self._projected = None
+        self.synced = False
+        self._store = Store(
+            hass, STORAGE_VERSION, STORAGE_KEY.format(slugify(self.name)))
+        self.available = True
+        self._failures = 0
+        self._unsub_refresh = None
+        self._refresh = None
+        self._next_refresh = None
+        self._force = set()
+        self._poll = PwPollInterval(self.scan_interval)
+        self._history_size = history_size(
+            min(self.scan_interval, FAST_SCAN_INTERVAL))
+        self._commands = {}
+        self._unsub_commands = None
+        self.profiler = None
+
+    def entity_name(self, name):
+        """Return the name of an entity, namespaced when there are several hubs."""
+        if self.namespace:
+            return '{}_{}'.format(self.name, name)
+        return name
+
+    def discover(self):
+        """Fetch the gateway data and discover the devices (executor).
+
+        This is the single discovery pass, all platforms create their
+        entities from the resulting topology and snapshot.
+        """
+        self.api.full_update_device()
+        self._set_topology(_discover(self.api.get_devices()))
+        self._fingerprint = self.api.fingerprint
+        _LOGGER.info('Topology %s', self.topology)
+        self.snapshot = self._build(self.topology)
+        self._record(self.snapshot, time.monotonic())
+        self.synced = True
+        self.stats.synced(self.api.last_sync, dt_util.utcnow())
+
+    async def async_restore(self):
+        """Restore the stored topology and snapshot, return if there were."""
+        stored = await self._store.async_load()
+        if stored is None:
+            return False
+        try:
+            self._set_topology(_load_topology(stored['topology']))
+            self.snapshot = PwColumns(
+                self._layout,
+                ((tuple(key), data) for key, data in stored['snapshot']))
+        except (KeyError, TypeError, ValueError):
+            _LOGGER.warning("Ignoring the invalid stored data of Adam %s",
+                            self.name)
+            self._set_topology(PwTopology(None, (), ()))
+            return False
+        _LOGGER.info("Restored the devices of Adam %s, refreshing them",
+                     self.name)
+        return True
+
+    def _set_topology(self, topology):
+        """Set the topology, with an empty snapshot in its layout."""
+        self.topology = topology
+        self._layout = slots(dev.key for dev in topology.devices)
+        self.snapshot = PwColumns(self._layout)
+
+    def add_platform(self, create, add_entities):
+        """Add the entities of a platform, also for later new devices.
+
+        Create returns the entities of the platform for a list of devices.
+        Each platform keeps the keys of the devices it created entities
+        for, so a platform set up from a topology that already has the new
+        devices doesn't add them twice.
+        """
+        with self._platforms_lock:
+            devices = self.topology.devices
+            self._platforms.append(
+                (create, add_entities, {dev.key for dev in devices}))
+            add_entities(create(self, devices), True)
+
+    def _add_devices(self):
+        """Add the entities of the new devices to all platforms (executor)."""
+        with self._platforms_lock:
+            devices = self.topology.devices
+            for create, add_entities, keys in self._platforms:
+                added = [dev for dev in devices if dev.key not in keys]
+                keys.clear()
+                keys.update(dev.key for dev in devices)
+                entities = create(self, added)
+                if entities:
+                    add_entities(entities, True)
+
+    async def _async_update_devices(self, previous):
+        """Add the entities of the new devices, remove the retired ones."""
+        keys = {dev.key for dev in previous.devices}
+        removed = keys.difference(self._layout)
+        added = [dev for dev in self.topology.devices if dev.key not in keys]
+        _LOGGER.info("The devices of Adam %s changed: %s added, %s removed",
+                     self.name, len(added), len(removed))
+        for entity in list(self.entities.values()):
+            if entity._key in removed:
+                await entity.async_remove()
+        for key in removed:
+            self.history.pop(key, None)
+            self._consumers.pop(key, None)
+            if self._projection is not None:
+                self._projection.pop(key, None)
+        await self.hass.async_add_executor_job(self._add_devices)
+        if added and self._projection is not None:
+            for dev in added:
+                self._projection.setdefault(dev.key, HUB_FIELDS)
+        self.async_save()
+
+    @callback
+    def async_save(self):
+        """Save the topology and snapshot, in a while."""
+        self._store.async_delay_save(self._stored, SAVE_DELAY)
+
+    def _stored(self):
+        """Return the topology and snapshot to store."""
+        return {
+            'topology': _dump_topology(self.topology),
+            'snapshot': [[list(key), None if data is None else dict(data)]
+                         for key, data in self.snapshot.items()],
+        }
+
+    @callback
+    def async_start(self):
+        """Start the periodic refresh, right away when not synced yet."""
+        if self.synced:
+            self._async_schedule_refresh()
+        else:
+            self.hass.async_create_task(self.async_refresh())
+
+    @callback
+    def _async_schedule_refresh(self):
+        """Schedule the next refresh, or probe when the gateway is down.
+
+        Without failures the refresh follows the adaptive interval, after a
+        failure the backoff delay.
+        """
+        if self._unsub_refresh is not None:
+            self._unsub_refresh()
+        if self._failures:
+            interval = self._backoff()
+        else:
+            interval = self._poll.next_interval(dt_util.utcnow())
+        action = self.async_refresh if self.available else self._async_probe
+        _LOGGER.debug("Next Adam %s %s in %s", self.name,
+                      'refresh' if self.available else 'probe', interval)
+        self._unsub_refresh = async_call_later(
+            self.hass, interval.total_seconds(), action)
+
+    def _backoff(self):
+        """Return the jittered exponential backoff after the failures."""
+        delay = min(BACKOFF_MAX, BACKOFF_MIN * 2 ** (self._failures - 1))
+        return delay * random.uniform(0.5, 1)
+
+    async def async_refresh(self, now=None, force=(), fresh=False):
+        """Call Adam to refresh information and notify the entities.
+
+        The devices in force are notified, even when their data is unchanged,
+        by the first refresh that succeeds.
+
+        There is only one refresh at a time: concurrent calls wait for the
+        refresh in flight. A fresh refresh has to start after the call (after
+        a command), so it waits for the next refresh, which is shared by all
+        fresh calls made meanwhile.
+        """
+        self._force.update(force)
+        if self._refresh is None:
+            self._refresh = self.hass.async_create_task(self._async_refresh())
+            await self._refresh
+        elif not fresh:
+            await self._refresh
+        else:
+            if self._next_refresh is None:
+                self._next_refresh = self.hass.async_create_task(
+                    self._async_refresh_next(self._refresh))
+            await self._next_refresh
+
+    async def _async_refresh_next(self, refresh):
+        """Refresh after the refresh in flight.
+
+        The refresh in flight is passed in, it can be done before this task
+        first runs.
+        """
+        try:
+            await refresh
+        finally:
+            self._next_refresh = None
+        await self.async_refresh()
+
+    async def _async_refresh(self):
+        """Refresh the snapshot and schedule the next refresh.
+
+        Any refresh restarts the timer of the next one, also after an
+        unexpected error, which counts as a failed poll.
+        """
         _LOGGER.debug("Collecting Adam data")
-        hass.data[DATA_ADAM].data.full_update_device()
-        dispatcher_send(hass, SIGNAL_UPDATE_ADAM)
+        force, self._force = self._force, set()
+        try:
+            snapshot, topology = await self.hass.async_add_executor_job(
+                self._fetch)
+            self._async_update(snapshot, topology, force)
+        except (OSError, RuntimeError) as err:
+            self._force.update(force)
+            self._async_failed(err)
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.error("Unexpected error refreshing Adam %s", self.name,
+                          exc_info=True)
+            self._force.update(force)
+            self._async_failed(err)
+        finally:
+            self._refresh = None
+            self._async_send_diagnostics()
+            self._async_profiled()
+            self._async_schedule_refresh()
 
-    # Call the Plugwise API to refresh updates
-    track_time_interval(hass, adam_refresh, scan_interval)
+    @callback
+    def _async_update(self, snapshot, topology, force):
+        """Swap in a new snapshot and notify the changed devices.
 
-    adam.full_update_device()
-    hass.helpers.discovery.load_platform('climate', DOMAIN, {}, config)
-    hass.helpers.discovery.load_platform('sensor', DOMAIN, {}, config)
-    hass.helpers.discovery.load_platform('switch', DOMAIN, {}, config)
-    hass.helpers.discovery.load_platform('water_heater', DOMAIN, {}, config)
+        The signal of a device carries its changed fields, or None when all
+        its entities have to update: when it is forced or the hub became
+        available again.
+        """
+        if not self.available:
+            _LOGGER.info("Adam %s is available again", self.name)
+            self.available = True
+            force = snapshot.keys()
+        self._failures = 0
+        self.synced = True
+        self.stats.synced(self.api.last_sync, dt_util.utcnow())
+        previous = self.topology
+        if topology is not previous:
+            self.topology = topology
+            self._layout = snapshot.layout
+        diff = snapshot.diff(self.snapshot)
+        self._poll.update(
+            self.snapshot, snapshot, diff, force, dt_util.utcnow())
+        changed = self._swap(snapshot, diff, force)
+        self._record(changed, time.monotonic())
+        for key in changed:
+            async_dispatcher_send(
+                self.hass, _signal(key),
+                None if key in force else diff.get(key))
+        if topology is not previous:
+            self.hass.async_create_task(
+                self._async_update_devices(previous))
+        elif changed:
+            self.async_save()
 
-    _LOGGER.info('Config %s', hass.data[DATA_ADAM])
-    return True
+    @callback
+    def _async_send_diagnostics(self):
+        """Notify the diagnostic sensors.
 
+        They are notified after the entities, so they see the writes of the
+        entities for this refresh.
+        """
+        if self.diagnostics:
+            async_dispatcher_send(
+                self.hass, SIGNAL_DIAGNOSTICS_ADAM.format(self.name))
 
-class PwHub:
-    """Representation of a base Plugwise device."""
+    @callback
+    def _async_failed(self, err):
+        """Count a failed refresh, and stop polling after too many."""
+        self._failures += 1
+        self.stats.failed += 1
+        if not self.available:
+            return
+        if self._failures < FAILURES_BEFORE_OPEN:
+            _LOGGER.warning("Unable to refresh Adam %s data: %s", self.name, err)
+            return
+        _LOGGER.error("Adam %s is unavailable, polling stopped until it "
+                      "answers again: %s", self.name, err)
+        self.available = False
+        for key in self.snapshot:
+            async_dispatcher_send(self.hass, _signal(key), None)
+
+    async def _async_probe(self, now=None):
+        """Check if the unavailable gateway answers again."""
+        try:
+            await self.hass.async_add_executor_job(self.api.ping_gateway)
+        except OSError:
+            self._failures += 1
+            self.stats.failed += 1
+            _LOGGER.debug("Adam %s still unavailable", self.name)
+            self._async_send_diagnostics()
+            self._async_schedule_refresh()
+            return
+        await self.async_refresh()
+
+    @callback
+    def async_queue_command(self, key, command, job, *args):
+        """Queue a command for the device with this key.
+
+        A command replaces the queued command of the same kind for the same
+        device, so only the last value set within COMMAND_DELAY is sent. All
+        queued commands are followed by a single refresh.
+        """
+        self._commands[(key, command)] = (job, args)
+        if self._unsub_commands is None:
+            self._unsub_commands = async_call_later(
+                self.hass, COMMAND_DELAY, self.async_send_commands)
+
+    async def async_send_commands(self, now=None):
+        """Send the queued commands now and refresh once."""
+        if self._unsub_commands is not None:
+            # Called by the timer (now), it is gone already
+            if now is None:
+                self._unsub_commands()
+            self._unsub_commands = None
+        commands, self._commands = self._commands, {}
+        if not commands:
+            return
+        if not self.available:
+            _LOGGER.error("Adam %s is unavailable, %s commands dropped",
+                          self.name, len(commands))
+            # The next refresh drops the values shown by the entities
+            self._force.update(key for key, _ in commands)
+            return
+        if not self.synced:
+            # The commands need the model of the gateway
+            await self.async_refresh()
+            if not self.synced:
+                _LOGGER.error("Adam %s is not reachable, %s commands dropped",
+                              self.name, len(commands))
+                self._force.update(key for key, _ in commands)
+                return
+        self._poll.boost(dt_util.utcnow())
+        started = time.monotonic()
+        await self._async_run_commands(commands)
+        self.stats.command = time.monotonic() - started
+        self._async_profiled()
+        await self.async_refresh(
+            force={key for key, _ in commands}, fresh=True)
+
+    async def _async_run_commands(self, commands):
+        """Send commands, to COMMAND_CONCURRENCY devices at a time.
 
-    def __init__(self, data):
-        """Initialize the device."""
-        self.data = data
+        The commands of a device are sent one by one, in the order queued.
+        """
+        devices = {}
+        for (key, _), command in commands.items():
+            devices.setdefault(key, []).append(command)
+        # A profile phase runs in one thread at a time
+        limit = 1 if self.profiler is not None else COMMAND_CONCURRENCY
+        semaphore = asyncio.Semaphore(limit)
+
+        async def send(device_commands):
+            async with semaphore:
+                await self.hass.async_add_executor_job(
+                    self.profiled, 'commands', self._send_commands,
+                    device_commands)
+
+        await asyncio.gather(*[send(device_commands)
+                               for device_commands in devices.values()])
+
+    def _send_commands(self, commands):
+        """Send commands to the gateway (executor)."""
+        for job, args in commands:
+            try:
+                job(*args)
+            except (OSError, RuntimeError):
+                _LOGGER.error("Unable to send command to Adam", exc_info=True)
+
+    def _swap(self, snapshot, diff, force=()):
+        """Replace the snapshot and return the keys of the changed devices."""
+        self.snapshot = snapshot
+        changed = [key for key in snapshot if key in force or key in diff]
+        _LOGGER.debug("%s of %s devices changed", len(changed), len(snapshot))
+        return changed
+
+    def _record(self, keys, now):
+        """Add the readings of the plugs with these keys to their history."""
+        for key in keys:
+            data = self.snapshot.get(key)
+            if key[2] is None or data is None:
+                continue
+            history = self.history.get(key)
+            if history is None:
+                history = self.history[key] = PwRingBuffer(
+                    size=self._history_size)
+            history.add(now, data)
+
+    def _fetch(self):
+        """Fetch the gateway data and build a new snapshot (executor).
+
+        Return the snapshot and the topology, a new one when the devices of
+        the gateway changed.
+        """
+        self.profiled('sync', self.api.full_update_device)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.add_sync(self.api.last_sync)
+        topology = self.topology
+        fingerprint = self.api.fingerprint
+        if fingerprint != self._fingerprint:
+            discovered = _discover(self.api.get_devices())
+            if discovered != topology:
+                topology = discovered
+        snapshot = self.profiled('build', self._build, topology)
+        self._fingerprint = fingerprint
+        return snapshot, topology
+
+    async def async_profile(self, count):
+        """Profile the next refreshes or commands."""
+        if self.profiler is not None:
+            _LOGGER.warning("Adam %s is already being profiled", self.name)
+            return
+        self.profiler = await self.hass.async_add_executor_job(
+            PwProfiler, self.name, count)
+        _LOGGER.info("Profiling the next %s refreshes or commands of Adam %s",
+                     count, self.name)
+
+    def profiled(self, phase, job, *args):
+        """Run a job, profiled as part of a phase when profiling."""
+        profiler = self.profiler
+        if profiler is None:
+            return job(*args)
+        return profiler.run(phase, job, *args)
+
+    @callback
+    def _async_profiled(self):
+        """Count a profiled refresh or command, report when complete."""
+        profiler = self.profiler
+        if profiler is None or not profiler.done():
+            return
+        # The task runs after the entity updates of this refresh, which are
+        # profiled until the task detaches the profiler
+        self.hass.async_create_task(self._async_report(profiler))
+
+    async def _async_report(self, profiler):
+        """Detach a profile and write its report."""
+        if self.profiler is not profiler:
+            return
+        self.profiler = None
+        path = await self.hass.async_add_executor_job(
+            profiler.report, self.hass.config.config_dir)
+        _LOGGER.warning("Profile of Adam %s written to %s", self.name, path)
+
+    def _build(self, topology):
+        """Build a snapshot of the devices from the data the api holds.
+
+        The data of each device is extracted once per refresh, whatever the
+        number of entities reading it, into a new store: the entities keep
+        reading the previous one meanwhile. Only the fields the entities
+        read are extracted, the others keep their last value. All fields of
+        the devices without entities yet are extracted.
+        """
+        layout = self._layout
+        if topology is not self.topology:
+            layout = slots(dev.key for dev in topology.devices)
+        projection = self._projection
+        return PwColumns(
+            layout,
+            ((dev.key, self.api.get_device_data(
+                *dev.key, fields=None if projection is None
+                else projection.get(dev.key)))
+             for dev in topology.devices),
+            previous=self.snapshot, projection=projection)
+
+    @callback
+    def async_consume(self, key, fields):
+        """Count the fields of a device an added entity reads."""
+        self._consumers.setdefault(key, Counter()).update(fields)
+        self._consumed.update(fields)
+        self._async_project(key)
+
+    @callback
+    def async_release(self, key, fields):
+        """Uncount the fields of a device a removed entity read."""
+        consumers = self._consumers.get(key)
+        if consumers is not None:
+            consumers.subtract(fields)
+            self._consumers[key] = +consumers
+        self._consumed.subtract(fields)
+        self._consumed = +self._consumed
+        self._async_project(key)
+
+    @callback
+    def _async_project(self, key):
+        """Restrict the refreshes to the fields the entities read.
+
+        Until the first entity is added, all fields are refreshed. The
+        projection is updated in place, one device at a time.
+        """
+        if self._projection is None:
+            self._projection = {
+                dev.key: HUB_FIELDS for dev in self.topology.devices}
+        self._projection[key] = HUB_FIELDS | frozenset(
+            self._consumers.get(key, ()))
+        fields = HUB_FIELDS.union(self._consumed)
+        if fields != self._projected:
+            self._projected = fields
+            self.api.set_fields(fields)
+
+
+class PwStats:
+    """Timing and counters of the refreshes of a hub, for the diagnostics.
+
+    The timing, bytes and entity counts are of the last refresh, the failed
+    polls are counted since the start.
+    """
+
+    def __init__(self):
+        """Initialize the counters."""
+        self.fetch = None
+        self.parse = None
+        self.size = None
+        self.updated = 0
+        self.suppressed = 0
+        self.failed = 0
+        self.last_response = None
+        self.command = None
+
+    def synced(self, sync, now):
+        """Start the counters of a refresh, after its sync with the gateway."""
+        if sync is not None:
+            self.fetch, self.parse, self.size = sync
+        self.updated = 0
+        self.suppressed = 0
+        self.last_response = now
+
+
+class PwPollInterval:
+    """The adaptive interval between the refreshes of a hub."""
+
+    def __init__(self, scan_interval):
+        """Initialize the interval."""
+        self._scan_interval = scan_interval
+        self._fast_until = None
+        self._stable = 0
+        # Minutes of the (local) day at which a schedule changed a setpoint
+        self._transitions = []
+
+    def boost(self, now):
+        """Poll fast for a while, after a command or an hvac state change."""
+        self._fast_until = now + FAST_SCAN_PERIOD
+        self._stable = 0
+
+    def update(self, previous, snapshot, diff, force, now):
+        """Learn from the changes (diff) between two snapshots.
+
+        A setpoint change of a device following a schedule, which is not
+        caused by a command (force), is remembered as a schedule transition.
+        """
+        hvac_changed = False
+        for key, fields in diff.items():
+            data = snapshot.get(key)
+            if data is None or previous.get(key) is None:
+                continue
+            if not fields.isdisjoint(HVAC_STATES):
+                hvac_changed = True
+            if (key not in force
+                    and 'setpoint_temp' in fields
+                    and data.get('selected_schedule') is not None):
+                self._add_transition(now)
+        if hvac_changed:
+            self.boost(now)
+        else:
+            self._stable += 1
+
+    def next_interval(self, now):
+        """Return the interval to the next refresh."""
+        if self._fast_until is not None and now < self._fast_until:
+            return FAST_SCAN_INTERVAL
+        if self._near_transition(now):
+            return FAST_SCAN_INTERVAL
+        if self._stable >= STABLE_REFRESHES:
+            return self._scan_interval * 2
+        return self._scan_interval
+
+    def _add_transition(self, now):
+        """Remember the minute of the day of a schedule transition."""
+        minute = _minute_of_day(now)
+        if minute in self._transitions:
+            return
+        self._transitions.append(minute)
+        del self._transitions[:-MAX_TRANSITIONS]
+
+    def _near_transition(self, now):
+        """Return if a known schedule transition is due.
+
+        A transition is only seen at the refresh after it, so the window
+        before it also covers the scan interval.
+        """
+        minute = _minute_of_day(now)
+        before = TRANSITION_WINDOW + self._scan_interval.total_seconds() / 60
+        for transition in self._transitions:
+            ahead = (transition - minute) % 1440
+            if ahead <= before or 1440 - ahead <= TRANSITION_WINDOW:
+                return True
+        return False
+
+
+def _minute_of_day(now):
+    """Return the minute of the local day."""
+    local = dt_util.as_local(now)
+    return local.hour * 60 + local.minute
+
+
+class PwDevice(namedtuple('PwDevice', ['name', 'dev_id', 'ctrl_id', 'plug_id'])):
+    """A discovered controller, thermostat (location) or plug."""
+
+    __slots__ = ()
+
+    @property
+    def key(self):
+        """Return the key of the device data in the snapshot."""
+        return (self.dev_id, self.ctrl_id, self.plug_id)
+
+
+class PwTopology(namedtuple('PwTopology', ['controller', 'thermostats', 'plugs'])):
+    """The devices of an Adam: its controller, thermostats and plugs."""
+
+    __slots__ = ()
+
+    @property
+    def devices(self):
+        """Return all devices."""
+        if self.controller is None:
+            return self.thermostats + self.plugs
+        return (self.controller,) + self.thermostats + self.plugs
+
+
+def _discover(devs):
+    """Build the topology from the device list of the api.
+
+    The controller is looked up first, so the thermostats get its id
+    whatever the order of the device list.
+    """
+    ctrl_id = None
+    for dev in devs:
+        if dev['type'] == CONTROLLER_TYPE:
+            ctrl_id = dev['id']
+
+    controller = None
+    if ctrl_id is not None:
+        controller = PwDevice('adam', None, ctrl_id, None)
+    thermostats = tuple(
+        PwDevice(dev['name'], dev['id'], ctrl_id, None)
+        for dev in devs if dev['type'] == 'thermostat')
+    plugs = tuple(
+        PwDevice(dev['name'], None, None, dev['id'])
+        for dev in devs if dev['type'] == 'plug')
+    return PwTopology(controller, thermostats, plugs)
+
+
+def _dump_topology(topology):
+    """Return the topology in a form to store."""
+    return {
+        'controller': None if topology.controller is None else list(
+            topology.controller),
+        'thermostats': [list(dev) for dev in topology.thermostats],
+        'plugs': [list(dev) for dev in topology.plugs],
+    }
+
+
+def _load_topology(stored):
+    """Return the topology from its stored form."""
+    controller = stored['controller']
+    return PwTopology(
+        None if controller is None else PwDevice(*controller),
+        tuple(PwDevice(*dev) for dev in stored['thermostats']),
+        tuple(PwDevice(*dev) for dev in stored['plugs']),
+    )
+
+
+def _signal(key):
+    """Return the update signal of the device with this key."""
+    return SIGNAL_UPDATE_ADAM.format('_'.join(str(part) for part in key))
 
 
 class PwEntity(Entity):
-    """Entity class for Plugwise devices."""
+    """Entity class for Plugwise devices.
+
+    The entity holds no copy of the device data, nor a row of a snapshot
+    which would keep that snapshot alive: it reads its fields from the
+    current hub snapshot. A value set by a command shows until the device
+    is forced, by the refresh after the command.
+
+    The hub only refreshes the FIELDS of the device data the added entities
+    read. The entities have a unique id, so they can be disabled in the
+    entity registry: disabled entities are never added.
+    """
+
+    FIELDS = ()
+
+    __slots__ = ('_hub', '_api', '_key', '_optimistic',
+                 '_unsub_dispatcher', '_written_available')
+
+    def __init__(self, hub, dev_id, ctrl_id, plug_id):
+        """Initialize the Plugwise entity."""
+        self._hub = hub
+        self._api = hub.api
+        self._key = (dev_id, ctrl_id, plug_id)
+        self._optimistic = None
+        self._unsub_dispatcher = None
+        self._written_available = True
+
+    @property
+    def should_poll(self):
+        """No polling needed, the hub pushes new data."""
+        return False
+
+    @property
+    def unique_id(self):
+        """Return the ids of the device, unique within the platform."""
+        return '-'.join(part for part in self._key if part is not None)
 
-    def __init__(self, data):
-        """Initialize the Hydrawise entity."""
-        self.data = data
+    @property
+    def available(self):
+        """Return if the gateway of the entity answers."""
+        return self._hub.available
 
     async def async_added_to_hass(self):
         """Register callbacks."""
-        async_dispatcher_connect(
-            self.hass, SIGNAL_UPDATE_ADAM, self._update_callback)
+        self._hub.entities[self.entity_id] = self
+        self._hub.async_consume(self._key, self._fields())
+        self._unsub_dispatcher = async_dispatcher_connect(
+            self.hass, _signal(self._key), self._update_callback)
+
+    async def async_will_remove_from_hass(self):
+        """Disconnect from the hub."""
+        self._hub.entities.pop(self.entity_id, None)
+        self._hub.async_release(self._key, self._fields())
+        if self._unsub_dispatcher is not None:
+            self._unsub_dispatcher()
+            self._unsub_dispatcher = None
+
+    def _fields(self):
+        """Return the fields of the device data the entity reads."""
+        return self.FIELDS
 
     @callback
-    def _update_callback(self):
-        """Call update method."""
-        self.async_schedule_update_ha_state(True)
+    def async_bulk_set(self, values):
+        """Queue the commands of a bulk set which apply to the entity."""
+
+    @callback
+    def _update_callback(self, fields=None):
+        """Update from the hub snapshot and write the state.
+
+        Only called when the data of this entity's device changed, with the
+        changed fields: the entity is left alone when it reads none of them.
+        Without fields (forced, or the availability changed) it updates and
+        drops the values set by commands.
+        """
+        if fields is None:
+            self._optimistic = None
+        elif (fields.isdisjoint(self._fields())
+              and self._written_available == self.available):
+            return
+        self._hub.profiled('entities', self._update_state)
+
+    def _update_state(self):
+        """Update the entity and write its state when worth it."""
+        self.update()
+        if self._written_available != self.available or self._should_write():
+            self._written_available = self.available
+            self.async_write_ha_state()
+            self._hub.stats.updated += 1
+        else:
+            self._hub.stats.suppressed += 1
+
+    def _should_write(self):
+        """Return if the updated state is worth writing."""
+        return True
+
+    def update(self):
+        """Update the entity from the latest hub snapshot."""
+        if self._hub.snapshot.get(self._key) is None:
+            _LOGGER.debug("Received no data for device %s.", self.name)
+
+    def _get(self, field):
+        """Return a field of the device data, None when missing."""
+        if self._optimistic is not None and field in self._optimistic:
+            return self._optimistic[field]
+        return self._hub.snapshot.lookup(self._key, field)
 
+    def _set_optimistic(self, field, value):
+        """Show a value set by a command, until the refresh after it."""
+        if self._optimistic is None:
+            self._optimistic = {}
+        self._optimistic[field] = value
@@ -3,7 +3,6 @@
 import logging
 
 import voluptuous as vol
-import plugwise
 
 import homeassistant.helpers.config_validation as cv
 from homeassistant.components.climate import PLATFORM_SCHEMA, ClimateDevice
@@ -19,13 +18,18 @@ from homeassistant.components.climate.const import (
     SUPPORT_TARGET_TEMPERATURE,
 )
 from homeassistant.const import (
+    CONF_NAME,
     ATTR_TEMPERATURE,
     TEMP_CELSIUS,
 )
 
+from homeassistant.core import callback
+
 from . import (
     DOMAIN,
     DATA_ADAM,
+    ATTR_PRESET_MODE,
+    ATTR_SCHEDULE,
     PwEntity,
 )
 
@@ -45,6 +49,9 @@ SUPPORT_FLAGS = (SUPPORT_TARGET_TEMPERATURE | SUPPORT_PRESET_MODE)
 
 THERMOSTAT_ICON = "mdi:thermometer"
 
+# Schedule state set by a command, shown until the refresh after it
+SCHEDULE_ACTIVE = "schedule_active"
+
 # Read platform configuration
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
@@ -59,26 +66,21 @@ def setup_platform(hass, config, add_entities, discovery_info=None):
     if discovery_info is None:
         return
 
-    api = hass.data[DATA_ADAM].data
+    hub = hass.data[DATA_ADAM][discovery_info[CONF_NAME]]
+    hub.add_platform(_create_entities, add_entities)
+
 
+def _create_entities(hub, devs):
+    """Return the thermostats of the devices."""
     devices = []
-    ctrl_id = None
-    try:
-        devs = api.get_devices()
-    except RuntimeError:
-        _LOGGER.error("Unable to get location info from the API")
-        return
-    
     for dev in devs:
-        if dev['name'] == 'Controlled Device':
-            ctrl_id = dev['id']
-        if dev['type'] == "thermostat":
-            device = PwThermostat(api, dev['name'], dev['id'], ctrl_id, DEFAULT_MIN_TEMP, DEFAULT_MAX_TEMP)
-            if not device:
-                continue
-            devices.append(device)
-            _LOGGER.info('Adding climate.%s', dev['name'])
-    add_entities(devices, True)
+        if dev.dev_id is None:
+            continue
+        name = hub.entity_name(dev.name)
+        device = PwThermostat(hub, name, dev.dev_id, dev.ctrl_id, DEFAULT_MIN_TEMP, DEFAULT_MAX_TEMP)
+        devices.append(device)
+        _LOGGER.info('Adding climate.%s', name)
+    return devices
 
 #    hass.helpers.discovery.load_platform('climate', DOMAIN, {}, config)
 
@@ -86,40 +88,44 @@ def setup_platform(hass, config, add_entities, discovery_info=None):
 class PwThermostat(PwEntity, ClimateDevice):
     """Representation of an Plugwise thermostat."""
 
-    def __init__(self, api, name, dev_id, ctlr_id, min_temp, max_temp):
+    FIELDS = (
+        'type', 'setpoint_temp', 'current_temp', 'active_preset',
+        'available_schedules', 'selected_schedule', 'last_used', 'presets',
+        'central_heating_state', 'boiler_state', 'dhw_state', 'cooling_state',
+    )
+
+    __slots__ = ('_name', '_dev_id', '_ctrl_id', '_min_temp', '_max_temp',
+                 '_presets', '_presets_list')
+
+    def __init__(self, hub, name, dev_id, ctlr_id, min_temp, max_temp):
         """Set up the Plugwise API."""
-        self._api = api
+        super().__init__(hub, dev_id, ctlr_id, None)
         self._name = name
         self._dev_id = dev_id
         self._ctrl_id = ctlr_id
         self._min_temp = min_temp
         self._max_temp = max_temp
-
-        self._dev_type = None
-        self._selected_schema = None
-        self._last_active_schema = None
-        self._preset_mode = None
         self._presets = None
         self._presets_list = None
-        self._boiler_status = None
-        self._cooling_status = None
-        self._dhw_status = None
-        self._heating_status = None
-        self._schema_names = None
-        self._schema_status = None
-        self._current_temp = None
-        self._thermostat_temp = None
-        self._boiler_temp = None
-        self._water_pressure = None
-        self._schedule_temp = None
-        self._hvac_mode = None
+
+    def _heating(self):
+        """Return if the boiler heats, for the rooms or the hot water."""
+        return (self._get('central_heating_state') or self._get('boiler_state')
+                or self._get('dhw_state'))
+
+    def _schema_status(self):
+        """Return if the thermostat follows a schedule."""
+        active = self._get(SCHEDULE_ACTIVE)
+        if active is None:
+            active = self._get('selected_schedule') is not None
+        return active
 
     @property
     def hvac_action(self):
         """Return the current action."""
-        if self._heating_status or self._boiler_status or self._dhw_status:
+        if self._heating():
             return CURRENT_HVAC_HEAT
-        if self._cooling_status:
+        if self._get('cooling_state'):
             return CURRENT_HVAC_COOL
         return CURRENT_HVAC_IDLE
 
@@ -142,10 +148,12 @@ class PwThermostat(PwEntity, ClimateDevice):
     def device_state_attributes(self):
         """Return the device specific state attributes."""
         attributes = {}
-        if self._schema_names:
-            attributes["available_schemas"] = self._schema_names
-        if self._selected_schema:
-            attributes["selected_schema"] = self._selected_schema
+        schema_names = self._get('available_schedules')
+        if schema_names:
+            attributes["available_schemas"] = schema_names
+        selected_schema = self._get('selected_schedule')
+        if selected_schema:
+            attributes["selected_schema"] = selected_schema
         return attributes
 
     @property
@@ -154,23 +162,29 @@ class PwThermostat(PwEntity, ClimateDevice):
         Return the available preset modes list and make the presets with their
         temperatures available.
         """
+        presets = self._get('presets')
+        # The presets are the same object until they change
+        if presets is not self._presets:
+            self._presets = presets
+            self._presets_list = list(presets) if presets else None
         return self._presets_list
 
     @property
     def hvac_modes(self):
         """Return the available hvac modes list."""
-        if self._heating_status is not None or self._boiler_status is not None:
-            if self._cooling_status is not None:
+        if (self._get('central_heating_state') is not None
+                or self._get('boiler_state') is not None):
+            if self._get('cooling_state') is not None:
                 return HVAC_MODES_2
             return HVAC_MODES_1
 
     @property
     def hvac_mode(self):
         """Return current active hvac state."""
-        if self._schema_status:
+        if self._schema_status():
             return HVAC_MODE_AUTO
-        if self._heating_status or self._boiler_status or self._dhw_status:
-            if self._cooling_status:
+        if self._heating():
+            if self._get('cooling_state'):
                 return HVAC_MODE_HEAT_COOL
             return HVAC_MODE_HEAT
         return HVAC_MODE_OFF
@@ -183,19 +197,19 @@ class PwThermostat(PwEntity, ClimateDevice):
         compared to the target_temperature-value. This way the information on the card
         is "immediately" updated after changing the preset, temperature, etc.
         """
-        return self._thermostat_temp
+        return self._get('setpoint_temp')
 
     @property
     def preset_mode(self):
         """Return the active preset."""
-        if self._presets:
-            return self._preset_mode
+        if self._get('presets'):
+            return self._get('active_preset')
         return None
 
     @property
     def current_temperature(self):
         """Return the current room temperature."""
-        return self._current_temp
+        return self._get('current_temp')
 
     @property
     def min_temp(self):
@@ -212,71 +226,68 @@ class PwThermostat(PwEntity, ClimateDevice):
         """Return the unit of measured temperature."""
         return TEMP_CELSIUS
         
-    def set_temperature(self, **kwargs):
+    async def async_set_temperature(self, **kwargs):
         """Set new target temperature."""
         temperature = kwargs.get(ATTR_TEMPERATURE)
-        if (temperature is not None) and (self._min_temp < temperature < self._max_temp):
-            _LOGGER.debug("Adjusting temperature to %s degrees C.", temperature)
-            self._api.set_temperature(self._dev_id, self._dev_type, temperature)
-            self._api.get_appliances()
-        else:
-            _LOGGER.error("Invalid temperature requested")
+        if temperature is not None and self._set_temperature(temperature):
+            self.async_write_ha_state()
 
-    def set_hvac_mode(self, hvac_mode):
+    async def async_set_hvac_mode(self, hvac_mode):
         """Set the hvac mode."""
         _LOGGER.debug("Adjusting hvac_mode to %s", hvac_mode)
-        state = "false"
-        if hvac_mode == HVAC_MODE_AUTO:
-            state = "true"
-        self._api.set_schedule_state(self._dev_id, self._last_active_schema, state)
-        self._api.get_domain_objects()
-        self._api.get_appliances()
-
-    def set_preset_mode(self, preset_mode):
-        _LOGGER.debug("Adjusting preset to %s", preset_mode)
+        self._set_schedule(hvac_mode == HVAC_MODE_AUTO)
+        self.async_write_ha_state()
+
+    async def async_set_preset_mode(self, preset_mode):
         """Set the preset mode."""
-        self._api.set_preset(self._dev_id, self._dev_type, preset_mode)
-        self._api.get_domain_objects()
-        self._api.get_appliances()
-
-    def update(self):
-        """Update the data for this climate device."""
-        _LOGGER.debug("Update climate called")
-        data = self._api.get_device_data(self._dev_id, self._ctrl_id, None)
-
-        if data is None:
-            _LOGGER.debug("Received no data for device %s.", self._name)
-        else:            
-            if 'type' in data:
-                self._dev_type = data['type']
-            if 'setpoint_temp' in data:
-                self._thermostat_temp = data['setpoint_temp']
-            if 'current_temp' in data:
-                self._current_temp = data['current_temp']
-            if 'boiler_temp' in data:
-                self._boiler_temp = data['boiler_temp']
-            if 'available_schedules' in data:
-                self._schema_names = data['available_schedules']
-            if 'selected_schedule' in data:
-                self._selected_schema = data['selected_schedule']
-                if self._selected_schema != None:
-                    self._schema_status = True
-                    self._schedule_temp = self._thermostat_temp
-                else:
-                    self._schema_status = False
-            if 'last_used' in data:
-                self._last_active_schema = data['last_used']
-            if 'presets' in data:
-                self._presets = data['presets']
-                if self._presets:
-                    self._presets_list = list(self._presets)
-            if 'active_preset' in data:
-                self._preset_mode = data['active_preset']
-            if 'boiler_state' in data:
-                self._boiler_status = data['boiler_state']
-            if 'central_heating_state' in data:
-                self._heating_status = data['central_heating_state']
-            if 'cooling_state' in data:
-                self._cooling_status = data['cooling_state']
-            if 'dhw_state' in data:
-                self._dhw_status = data['dhw_state']
+        self._set_preset(preset_mode)
+        self.async_write_ha_state()
+
+    @callback
+    def async_bulk_set(self, values):
+        """Queue the schedule, preset and setpoint of a bulk set.
+
+        In that order, so the setpoint isn't overridden by the others.
+        """
+        queued = False
+        if ATTR_SCHEDULE in values:
+            self._set_schedule(values[ATTR_SCHEDULE])
+            queued = True
+        if ATTR_PRESET_MODE in values:
+            self._set_preset(values[ATTR_PRESET_MODE])
+            queued = True
+        if ATTR_TEMPERATURE in values:
+            queued |= self._set_temperature(values[ATTR_TEMPERATURE])
+        if queued:
+            self.async_write_ha_state()
+
+    @callback
+    def _set_temperature(self, temperature):
+        """Queue a new setpoint, return if it is valid."""
+        if not self._min_temp < temperature < self._max_temp:
+            _LOGGER.error("Invalid temperature requested")
+            return False
+        _LOGGER.debug("Adjusting temperature to %s degrees C.", temperature)
+        self._hub.async_queue_command(
+            self._key, 'temperature', self._api.set_temperature,
+            self._dev_id, self._get('type'), temperature)
+        self._set_optimistic('setpoint_temp', temperature)
+        return True
+
+    @callback
+    def _set_schedule(self, active):
+        """Queue switching the last used schedule on or off."""
+        state = "true" if active else "false"
+        self._hub.async_queue_command(
+            self._key, 'schedule', self._api.set_schedule_state,
+            self._dev_id, self._get('last_used'), state)
+        self._set_optimistic(SCHEDULE_ACTIVE, active)
+
+    @callback
+    def _set_preset(self, preset_mode):
+        """Queue a new preset."""
+        _LOGGER.debug("Adjusting preset to %s", preset_mode)
+        self._hub.async_queue_command(
+            self._key, 'preset', self._api.set_preset,
+            self._dev_id, self._get('type'), preset_mode)
+        self._set_optimistic('active_preset', preset_mode)
@@ -0,0 +1,344 @@
+"""Columnar store of the device data of an Adam.
+
+A snapshot of the data of all devices of a hub is kept in columns: one
+typed array per numeric field and per on/off state, one list per other
+field, each device in a row (slot) of its own. Which fields a device has is
+kept in a bitmask per row. The snapshot of each refresh is a new store in
+the same layout as the one before, so two snapshots are compared column by
+column.
+
+A store can be built from the one before, updating only some fields of
+each device (a projection): the other fields keep their last value. When
+the devices changed, the store is in a new layout and the rows of the
+devices in both are copied over.
+
+The store reads as a mapping of device key to a read-only row of that
+device, or None when there was no data of the device.
+"""
+
+import math
+from array import array
+from collections.abc import Mapping
+from functools import lru_cache
+
+# Fields of the device data by kind of column
+FLOAT_FIELDS = (
+    "setpoint_temp",
+    "current_temp",
+    "boiler_temp",
+    "water_pressure",
+    "outdoor_temp",
+    "battery",
+    "illuminance",
+    "trv_1_battery",
+    "trv_1_current_temp",
+    "trv_2_battery",
+    "trv_2_current_temp",
+    "trv_3_battery",
+    "trv_3_current_temp",
+    "electricity_consumed",
+    "electricity_consumed_interval",
+    "electricity_produced",
+    "electricity_produced_interval",
+)
+STATE_FIELDS = (
+    "central_heating_state",
+    "boiler_state",
+    "dhw_state",
+    "cooling_state",
+)
+OBJECT_FIELDS = (
+    "type",
+    "relay",
+    "active_preset",
+    "available_schedules",
+    "selected_schedule",
+    "last_used",
+    "presets",
+)
+
+# Bit of each field in the masks, fields not known above are added as
+# object fields when first seen
+_BITS = {field: bit for bit, field in enumerate(
+    FLOAT_FIELDS + STATE_FIELDS + OBJECT_FIELDS)}
+MAX_FIELDS = 63
+# Bit set in the mask of each device with data
+HAS_DATA = 1 << MAX_FIELDS
+
+# Stored value of a missing float and state
+NAN = math.nan
+NO_STATE = -1
+
+
+def slots(keys):
+    """Return the layout of a store: the slot of each device key."""
+    return {key: slot for slot, key in enumerate(keys)}
+
+
+@lru_cache(maxsize=64)
+def _mask(fields):
+    """Return the mask of a frozenset of fields."""
+    mask = 0
+    for field in fields:
+        mask |= 1 << _bit(field)
+    return mask
+
+
+def _bit(field):
+    """Return the bit of a field, adding it when new."""
+    bit = _BITS.get(field)
+    if bit is None:
+        if len(_BITS) >= MAX_FIELDS:
+            raise ValueError("Too many device data fields")
+        bit = _BITS.setdefault(field, len(_BITS))
+    return bit
+
+
+class PwColumns(Mapping):
+    """The data of the devices of a hub, in columns."""
+
+    __slots__ = ("_slots", "_keys", "_masks", "_floats", "_states",
+                 "_objects")
+
+    def __init__(self, layout, rows=(), previous=None, projection=None):
+        """Build a store in a layout from (key, data) rows.
+
+        Data is a dict of the fields of a device, or None. With a previous
+        store and a projection ({key: frozenset of fields, or None for all}),
+        the data of a device only updates the fields in its projection, the
+        others keep their value in the previous store.
+        """
+        size = len(layout)
+        self._slots = layout
+        self._keys = tuple(layout)
+        if (previous is None or projection is None
+                or previous._slots is not layout):
+            self._masks = array("Q", [0]) * size
+            self._floats = {field: array("d", [NAN]) * size
+                            for field in FLOAT_FIELDS}
+            self._states = {field: array("b", [NO_STATE]) * size
+                            for field in STATE_FIELDS}
+            self._objects = {field: [None] * size for field in OBJECT_FIELDS}
+            if previous is None or projection is None:
+                projection = None
+            else:
+                self._copy_rows(previous)
+        else:
+            self._masks = previous._masks[:]
+            self._floats = {field: column[:]
+                            for field, column in previous._floats.items()}
+            self._states = {field: column[:]
+                            for field, column in previous._states.items()}
+            self._objects = {field: column[:]
+                             for field, column in previous._objects.items()}
+        for key, data in rows:
+            slot = layout.get(key)
+            if slot is None:
+                continue
+            if data is None:
+                self._masks[slot] = 0
+            elif projection is None:
+                self._set(slot, data)
+            else:
+                self._set(slot, data, projection.get(key))
+
+    def _set(self, slot, data, fields=None):
+        """Fill a row with the fields of a device.
+
+        With fields, only those are set, the other fields are kept.
+        """
+        mask = HAS_DATA
+        if fields is not None:
+            mask |= self._masks[slot] & ~_mask(fields)
+        for field, value in data.items():
+            if fields is not None and field not in fields:
+                continue
+            mask |= 1 << _bit(field)
+            column = self._floats.get(field)
+            if column is not None:
+                column[slot] = NAN if value is None else value
+                continue
+            column = self._states.get(field)
+            if column is not None:
+                column[slot] = NO_STATE if value is None else bool(value)
+                continue
+            column = self._objects.get(field)
+            if column is None:
+                column = self._objects[field] = [None] * len(self._keys)
+            column[slot] = value
+        self._masks[slot] = mask
+
+    def _copy_rows(self, previous):
+        """Copy the rows of the devices in a store of another layout."""
+        size = len(self._keys)
+        for key, slot in self._slots.items():
+            old = previous._slots.get(key)
+            if old is None:
+                continue
+            self._masks[slot] = previous._masks[old]
+            for columns, old_columns in ((self._floats, previous._floats),
+                                         (self._states, previous._states),
+                                         (self._objects, previous._objects)):
+                for field, old_column in old_columns.items():
+                    column = columns.get(field)
+                    if column is None:
+                        column = columns[field] = [None] * size
+                    column[slot] = old_column[old]
+
+    @property
+    def layout(self):
+        """Return the layout of the store."""
+        return self._slots
+
+    def __getitem__(self, key):
+        """Return the row of a device, None when it has no data."""
+        slot = self._slots[key]
+        if not self._masks[slot]:
+            return None
+        return PwRow(self, slot)
+
+    def __iter__(self):
+        """Iterate over the device keys."""
+        return iter(self._keys)
+
+    def __len__(self):
+        """Return the number of devices."""
+        return len(self._keys)
+
+    def __contains__(self, key):
+        """Return if a device is in the store."""
+        return key in self._slots
+
+    def value(self, slot, field):
+        """Return a field of a row, None when missing."""
+        column = self._floats.get(field)
+        if column is not None:
+            value = column[slot]
+            return None if math.isnan(value) else value
+        column = self._states.get(field)
+        if column is not None:
+            value = column[slot]
+            return None if value == NO_STATE else bool(value)
+        column = self._objects.get(field)
+        if column is not None:
+            return column[slot]
+        return None
+
+    def lookup(self, key, field):
+        """Return a field of a device, None when missing."""
+        slot = self._slots.get(key)
+        if slot is None or not self.has(slot, field):
+            return None
+        return self.value(slot, field)
+
+    def has(self, slot, field):
+        """Return if a row has a field."""
+        bit = _BITS.get(field)
+        return bit is not None and bool(self._masks[slot] >> bit & 1)
+
+    def fields(self, slot):
+        """Return the fields of a row."""
+        mask = self._masks[slot]
+        return [field for field, bit in list(_BITS.items())
+                if mask >> bit & 1]
+
+    def diff(self, previous):
+        """Return the changed fields of each changed device, by key.
+
+        The data of a device that appeared or disappeared changed in all
+        its fields.
+        """
+        if previous is None or previous._slots is not self._slots:
+            return _diff_rows(previous or {}, self)
+
+        changed = {}
+
+        def mark(slot, field):
+            changed.setdefault(self._keys[slot], set()).add(field)
+
+        for slot, (mask, old) in enumerate(zip(self._masks, previous._masks)):
+            if mask != old:
+                for field, bit in list(_BITS.items()):
+                    if (mask ^ old) >> bit & 1:
+                        mark(slot, field)
+                if not mask or not old:
+                    changed.setdefault(self._keys[slot], set()).update(
+                        self.fields(slot) or previous.fields(slot))
+
+        for columns, old_columns in ((self._floats, previous._floats),
+                                     (self._states, previous._states)):
+            for field, column in columns.items():
+                old_column = old_columns[field]
+                # NaN is always stored with the same bits
+                if column.tobytes() == old_column.tobytes():
+                    continue
+                for slot, (value, old) in enumerate(zip(column, old_column)):
+                    if value != old and not (value != value and old != old):
+                        mark(slot, field)
+
+        for field, column in self._objects.items():
+            old_column = previous._objects.get(field)
+            if column == old_column:
+                continue
+            if old_column is None:
+                old_column = [None] * len(column)
+            for slot, (value, old) in enumerate(zip(column, old_column)):
+                if value != old:
+                    mark(slot, field)
+        return changed
+
+
+def _diff_rows(previous, snapshot):
+    """Return the changed fields by key, comparing the rows one by one."""
+    changed = {}
+    for key in snapshot:
+        old = previous.get(key)
+        new = snapshot.get(key)
+        if old is None and new is None:
+            continue
+        old = dict(old or {})
+        new = dict(new or {})
+        fields = {field for field in set(old) | set(new)
+                  if old.get(field) != new.get(field)}
+        if fields or (old == {}) != (new == {}):
+            changed[key] = fields
+    return changed
+
+
+class PwRow(Mapping):
+    """The read-only data of one device in a store."""
+
+    __slots__ = ("_columns", "_slot")
+
+    def __init__(self, columns, slot):
+        """Point at a row of a store."""
+        self._columns = columns
+        self._slot = slot
+
+    def __getitem__(self, field):
+        """Return a field, KeyError when the device doesn't have it."""
+        if not self._columns.has(self._slot, field):
+            raise KeyError(field)
+        return self._columns.value(self._slot, field)
+
+    def get(self, field, default=None):
+        """Return a field, or the default when the device doesn't have it."""
+        if not self._columns.has(self._slot, field):
+            return default
+        return self._columns.value(self._slot, field)
+
+    def __contains__(self, field):
+        """Return if the device has a field."""
+        return self._columns.has(self._slot, field)
+
+    def __iter__(self):
+        """Iterate over the fields of the device."""
+        return iter(self._columns.fields(self._slot))
+
+    def __len__(self):
+        """Return the number of fields."""
+        return len(self._columns.fields(self._slot))
+
+    def __repr__(self):
+        """Return the fields and values."""
+        return repr(dict(self))
@@ -0,0 +1,731 @@
+"""Plugwise Adam gateway client for the adam component.
+
+A stand-in for plugwise.Plugwise: the methods used by the component have the
+same names and signatures. The client keeps a model of the domain objects of
+the gateway, which is refreshed incrementally: only the objects modified
+since the last sync are fetched and merged into the model.
+
+Responses are parsed in a streaming pass, one top-level object at a time, as
+they come in. Of each object only a compact record of the fields the
+component uses is kept.
+
+The schedules and presets of a location, which derive from the rules and
+hardly ever change, are cached until a rule of the location changes.
+
+The data can be restricted to the fields the component reads (set_fields):
+only the logs of those fields are parsed, and only those fields are
+extracted from the model. Objects new to the model are parsed with all
+logs, so the entities of new devices can be set up.
+
+A fingerprint of the devices (their ids, names and types) is kept up to
+date with each merged object, so a change of the device list is noticed
+without comparing the lists.
+
+All clients of the same host share one pooled HTTP session, which keeps its
+connections alive and accepts compressed responses.
+"""
+
+import logging
+import re
+import threading
+import time
+import xml.etree.ElementTree as Etree
+from collections import namedtuple
+from datetime import datetime
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_LOGGER = logging.getLogger(__name__)
+
+# API endpoints
+PING = "/ping"
+DOMAIN_OBJECTS = "/core/domain_objects"
+APPLIANCES = "/core/appliances"
+LOCATIONS = "/core/locations"
+RULES = "/core/rules"
+MODIFIED_SINCE = ";modified_date:ge:{}"
+# Seconds to connect, to wait for each part of a response, and for a whole
+# response
+CONNECT_TIMEOUT = 5
+TIMEOUT = 10
+DEADLINE = 30
+# Bytes of a response fed to the parser at once
+CHUNK_SIZE = 65536
+# Connections per host, the gateways have a weak HTTP server: more requests
+# at once (refreshes, commands, hubs on the same host) wait for one
+POOL_SIZE = 2
+
+# An incremental fetch doesn't show removed objects, so resync everything
+# every so often, in seconds
+FULL_SYNC_INTERVAL = 900
+
+# Rule templates
+SCHEDULE_TEMPLATE = "zone_preset_based_on_time_and_presence_with_override"
+PRESET_TEMPLATE = "zone_setpoint_and_state_based_on_preset"
+
+# Appliance types
+CONTROLLER_TYPE = "heater_central"
+THERMOSTAT_TYPES = ("zone_thermostat", "thermostat")
+TRV_TYPE = "thermostatic_radiator_valve"
+NO_PLUG_TYPES = (
+    "gateway",
+    "heater_central",
+    "central_heating_pump",
+    "thermostatic_radiator_valve",
+    "zone_thermostat",
+    "thermostat",
+)
+MAX_TRVS = 3
+
+# Log type of the controller: key in the device data
+CONTROLLER_MEASUREMENTS = {
+    "boiler_temperature": "boiler_temp",
+    "central_heater_water_pressure": "water_pressure",
+}
+CONTROLLER_STATES = {
+    "central_heating_state": "central_heating_state",
+    "boiler_state": "boiler_state",
+    "domestic_hot_water_state": "dhw_state",
+    "cooling_state": "cooling_state",
+}
+PLUG_MEASUREMENTS = ("electricity_consumed", "electricity_produced")
+
+# Fields of the device data: the log type they are read from
+POINT_FIELDS = {
+    "current_temp": "temperature",
+    "battery": "battery",
+    "illuminance": "illuminance",
+    "outdoor_temp": "outdoor_temperature",
+}
+POINT_FIELDS.update(
+    {"trv_{}_{}".format(trv, key): log_type
+     for trv in range(1, MAX_TRVS + 1)
+     for key, log_type in (("battery", "battery"),
+                           ("current_temp", "temperature"))})
+POINT_FIELDS.update(
+    {key: log_type for log_type, key in CONTROLLER_MEASUREMENTS.items()})
+POINT_FIELDS.update(
+    {key: log_type for log_type, key in CONTROLLER_STATES.items()})
+POINT_FIELDS.update({log_type: log_type for log_type in PLUG_MEASUREMENTS})
+INTERVAL_FIELDS = {
+    log_type + "_interval": log_type for log_type in PLUG_MEASUREMENTS}
+
+# Fields of a thermostat from its rules, and from the appliances in its
+# location
+METADATA_FIELDS = frozenset(
+    ("available_schedules", "selected_schedule", "last_used", "presets"))
+APPLIANCE_FIELDS = frozenset(
+    ["battery", "illuminance"]
+    + [key for key in POINT_FIELDS if key.startswith("trv_")])
+
+# The logs kept in the records, all others are skipped while parsing
+POINT_LOGS = frozenset(POINT_FIELDS.values())
+INTERVAL_LOGS = frozenset(INTERVAL_FIELDS.values())
+ALL_LOGS = {'point_log': POINT_LOGS, 'interval_log': INTERVAL_LOGS}
+
+# Compact records of the domain objects
+Appliance = namedtuple('Appliance', [
+    'name', 'type', 'location', 'logs', 'intervals', 'relay', 'modified'])
+Location = namedtuple('Location', [
+    'name', 'type', 'preset', 'appliances', 'thermostat', 'setpoint', 'logs',
+    'modified'])
+Rule = namedtuple('Rule', [
+    'name', 'tag', 'template', 'active', 'locations', 'presets', 'modified'])
+
+# The last update of the model: seconds fetching (waiting for the gateway),
+# seconds parsing, bytes received
+Sync = namedtuple('Sync', ['fetch', 'parse', 'size'])
+
+
+ILLEGAL_AMPERSAND = re.compile(rb"&([^a-zA-Z#])")
+
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+class ResponseError(OSError):
+    """The gateway answered a request with an error status."""
+
+
+def _session(host, port):
+    """Return the shared session of a host, creating it when needed."""
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get((host, port))
+        if session is None:
+            session = requests.Session()
+            session.headers['Accept-Encoding'] = 'gzip, deflate'
+            session.mount('http://', HTTPAdapter(
+                pool_connections=1, pool_maxsize=POOL_SIZE, pool_block=True))
+            _SESSIONS[(host, port)] = session
+        return session
+
+
+def close_sessions():
+    """Close the sessions of all hosts."""
+    with _SESSIONS_LOCK:
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
+
+
+class PwGateway:
+    """Client of a Plugwise Adam (or Smile with firmware 3.x)."""
+
+    def __init__(self, username, password, host, port):
+        """Set up the client."""
+        self._endpoint = "http://{}:{}".format(host, port)
+        self._auth = (username, password)
+        self._session = _session(host, port)
+        self._appliances = {}
+        self._locations = {}
+        self._rules = {}
+        self._metadata = {}
+        self._wanted = ALL_LOGS
+        # The logs all records of the model were parsed with
+        self._parsed = {'point_log': frozenset(), 'interval_log': frozenset()}
+        self._modified = None
+        self._synced_at = None
+        self._incremental = True
+        self._parse_time = 0
+        self._received = 0
+        self.last_sync = None
+        self.fingerprint = 0
+
+    def ping_gateway(self):
+        """Check the gateway is reachable."""
+        self._request(PING).close()
+
+    def full_update_device(self):
+        """Update the model of the gateway, incrementally when possible.
+
+        The timing and size of the update are kept in last_sync.
+        """
+        started = time.monotonic()
+        self._parse_time = 0
+        self._received = 0
+        self._update()
+        duration = time.monotonic() - started
+        self.last_sync = Sync(
+            duration - self._parse_time, self._parse_time, self._received)
+
+    def set_fields(self, fields):
+        """Restrict the data to these fields, all fields when None.
+
+        When logs are wanted which weren't parsed before, the next update
+        fetches all objects again.
+        """
+        if fields is None:
+            wanted = ALL_LOGS
+        else:
+            fields = frozenset(fields)
+            wanted = {
+                'point_log': frozenset(
+                    POINT_FIELDS[key] for key in fields if key in POINT_FIELDS),
+                'interval_log': frozenset(
+                    INTERVAL_FIELDS[key] for key in fields
+                    if key in INTERVAL_FIELDS),
+            }
+        self._wanted = wanted
+
+    def _update(self):
+        """Update the model, incrementally when possible."""
+        wanted = self._wanted
+        if (not self._incremental or self._modified is None
+                or any(not wanted[log] <= self._parsed[log] for log in wanted)
+                or time.monotonic() - self._synced_at > FULL_SYNC_INTERVAL):
+            self.get_domain_objects()
+            return
+
+        path = DOMAIN_OBJECTS + MODIFIED_SINCE.format(quote(self._modified))
+        try:
+            response = self._request(path, stream=True)
+        except ResponseError:
+            _LOGGER.info("Incremental updates not supported, using full updates")
+            self._incremental = False
+            self.get_domain_objects()
+            return
+
+        if not self._merge(response, full=False):
+            _LOGGER.debug("Inconsistent incremental update, resyncing")
+            self.get_domain_objects()
+
+    def get_domain_objects(self):
+        """Replace the model by all domain objects of the gateway."""
+        self._merge(self._request(DOMAIN_OBJECTS, stream=True), full=True)
+        self._synced_at = time.monotonic()
+
+    def get_devices(self):
+        """Return the controller, thermostats (locations) and plugs."""
+        devices = []
+        for appl_id, appliance in self._appliances.items():
+            if appliance.type == CONTROLLER_TYPE:
+                devices.append({
+                    'name': appliance.name,
+                    'id': appl_id,
+                    'type': appliance.type,
+                })
+            elif appliance.type not in NO_PLUG_TYPES and appliance.relay is not None:
+                devices.append({
+                    'name': appliance.name,
+                    'id': appl_id,
+                    'type': 'plug',
+                })
+        for loc_id, location in self._locations.items():
+            if location.thermostat is not None:
+                devices.append({
+                    'name': location.name,
+                    'id': loc_id,
+                    'type': 'thermostat',
+                })
+        return devices
+
+    def get_device_data(self, dev_id, ctrl_id, plug_id, fields=None):
+        """Return the data of a thermostat, the controller or a plug.
+
+        With fields, the data holds at least those fields, all it has
+        without.
+        """
+        if plug_id is not None:
+            return self._plug_data(plug_id)
+        if dev_id is not None:
+            return self._thermostat_data(dev_id, ctrl_id, fields)
+        if ctrl_id is not None:
+            return self._controller_data(ctrl_id, fields)
+        return None
+
+    def set_temperature(self, loc_id, loc_type, temperature):
+        """Set the setpoint of a location."""
+        location = self._locations[loc_id]
+        uri = "{};id={}/thermostat;id={}".format(
+            LOCATIONS, loc_id, location.thermostat)
+        data = ("<thermostat_functionality><setpoint>{}</setpoint>"
+                "</thermostat_functionality>".format(temperature))
+        self._request(uri, 'put', data).close()
+
+    def set_preset(self, loc_id, loc_type, preset):
+        """Set the preset of a location."""
+        location = self._locations[loc_id]
+        uri = "{};id={}".format(LOCATIONS, loc_id)
+        data = ('<locations><location id="{}"><name>{}</name><type>{}</type>'
+                '<preset>{}</preset></location></locations>'.format(
+                    loc_id, location.name, location.type, preset))
+        self._request(uri, 'put', data).close()
+        self._metadata.pop(loc_id, None)
+
+    def set_schedule_state(self, loc_id, name, state):
+        """Switch the schedule with this name of a location on or off."""
+        for rule_id, rule in self._rules_of(loc_id, SCHEDULE_TEMPLATE):
+            if rule.name != name:
+                continue
+            uri = "{};id={}".format(RULES, rule_id)
+            data = ('<rules><rule id="{}"><name><![CDATA[{}]]></name>'
+                    '<template id="{}" /><active>{}</active></rule>'
+                    '</rules>'.format(rule_id, name, rule.template, state))
+            self._request(uri, 'put', data).close()
+        self._metadata.pop(loc_id, None)
+
+    def set_relay_state(self, appl_id, appl_type, state):
+        """Switch the relay of a plug on or off."""
+        uri = "{};id={}/relay".format(APPLIANCES, appl_id)
+        data = ("<relay_functionality><state>{}</state>"
+                "</relay_functionality>".format(state))
+        self._request(uri, 'put', data).close()
+
+    def _request(self, path, method='get', data=None, stream=False):
+        """Send a request to the gateway and return the response.
+
+        A streamed response returns its connection to the pool once it has
+        been read completely or closed.
+        """
+        headers = None
+        if data is not None:
+            headers = {'Content-Type': 'text/xml'}
+        response = self._session.request(
+            method, self._endpoint + path, auth=self._auth, data=data,
+            headers=headers, timeout=(CONNECT_TIMEOUT, TIMEOUT), stream=stream)
+        if response.status_code not in (requests.codes.ok,
+                                         requests.codes.accepted):
+            response.close()
+            raise ResponseError("{} {} returned {}".format(
+                method.upper(), path, response.status_code))
+        return response
+
+    def _merge(self, response, full):
+        """Merge the objects in the response into the model.
+
+        Return False when the merged model is inconsistent: objects refer to
+        locations or appliances the model doesn't know.
+        """
+        known = {
+            'appliance': self._appliances,
+            'location': self._locations,
+            'rule': self._rules,
+        }
+        if full:
+            models = {'appliance': {}, 'location': {}, 'rule': {}}
+            modified = None
+            fingerprint = 0
+        else:
+            models = {tag: dict(objects) for tag, objects in known.items()}
+            modified = self._modified
+            fingerprint = self.fingerprint
+
+        started = time.monotonic()
+        wanted = self._wanted
+        with response:
+            chunks = _Chunks(response, started + DEADLINE)
+            for element in _objects(_escape_illegal_xml_characters(chunks)):
+                objects = models.get(element.tag)
+                object_id = element.get('id')
+                if objects is None or object_id is None:
+                    continue
+                record = RECORDS[element.tag](
+                    element,
+                    wanted if object_id in known[element.tag] else ALL_LOGS)
+                fingerprint ^= (_fingerprint(object_id, objects.get(object_id))
+                                ^ _fingerprint(object_id, record))
+                objects[object_id] = record
+                if record.modified and (modified is None or _date(
+                        record.modified) > _date(modified)):
+                    modified = record.modified
+            self._received += _size(response, chunks)
+        self._parse_time += time.monotonic() - started - chunks.waited
+
+        self._invalidate_metadata(models['rule'], models['location'])
+        self._appliances = models['appliance']
+        self._locations = models['location']
+        self._rules = models['rule']
+        self._modified = modified
+        self.fingerprint = fingerprint
+        if full:
+            self._parsed = wanted
+        else:
+            self._parsed = {log: self._parsed[log] & wanted[log]
+                            for log in wanted}
+        return self._consistent()
+
+    def _invalidate_metadata(self, rules, locations):
+        """Drop the cached metadata of the locations of the changed rules."""
+        for rule_id in set(self._rules) | set(rules):
+            old = self._rules.get(rule_id)
+            new = rules.get(rule_id)
+            if old is new or old == new:
+                continue
+            for rule in (old, new):
+                if rule is not None:
+                    for loc_id in rule.locations:
+                        self._metadata.pop(loc_id, None)
+        # Commands drop metadata meanwhile, from other threads
+        for loc_id in list(self._metadata):
+            if loc_id not in locations:
+                self._metadata.pop(loc_id, None)
+
+    def _consistent(self):
+        """Return if all references between the objects resolve."""
+        for appliance in self._appliances.values():
+            if (appliance.location is not None
+                    and appliance.location not in self._locations):
+                return False
+        for location in self._locations.values():
+            for appl_id in location.appliances:
+                if appl_id not in self._appliances:
+                    return False
+        return True
+
+    def _appliances_in(self, loc_id):
+        """Return the appliances in a location, ordered by id."""
+        return [appliance for _, appliance in sorted(self._appliances.items())
+                if appliance.location == loc_id]
+
+    def _rules_of(self, loc_id, template):
+        """Return the (id, rule) of the rules with a template for a location."""
+        return [(rule_id, rule) for rule_id, rule in self._rules.items()
+                if rule.tag == template and loc_id in rule.locations]
+
+    def _controller_data(self, ctrl_id, fields=None):
+        """Return the data of the controller (boiler)."""
+        controller = self._appliances.get(ctrl_id)
+        if controller is None:
+            return None
+        data = {'type': controller.type}
+        for log_type, key in CONTROLLER_MEASUREMENTS.items():
+            data[key] = _float(controller.logs.get(log_type))
+        for log_type, key in CONTROLLER_STATES.items():
+            data[key] = _state(controller.logs.get(log_type))
+        if fields is None or 'outdoor_temp' in fields:
+            data['outdoor_temp'] = self._outdoor_temperature()
+        return data
+
+    def _outdoor_temperature(self):
+        """Return the outdoor temperature, measured or from the weather."""
+        for record in list(self._appliances.values()) + list(
+                self._locations.values()):
+            value = record.logs.get('outdoor_temperature')
+            if value is not None:
+                return _float(value)
+        return None
+
+    def _thermostat_data(self, loc_id, ctrl_id, fields=None):
+        """Return the data of a thermostat (location)."""
+        location = self._locations.get(loc_id)
+        if location is None:
+            return None
+        data = {
+            'type': location.type,
+            'setpoint_temp': _float(location.setpoint),
+            'current_temp': _float(location.logs.get('temperature')),
+            'active_preset': location.preset,
+        }
+        if fields is None or not fields.isdisjoint(METADATA_FIELDS):
+            data.update(self._location_metadata(loc_id))
+
+        trv = 0
+        appliances = ()
+        if fields is None or not fields.isdisjoint(APPLIANCE_FIELDS):
+            appliances = self._appliances_in(loc_id)
+        for appliance in appliances:
+            if appliance.type in THERMOSTAT_TYPES:
+                data['battery'] = _float(appliance.logs.get('battery'))
+                data['illuminance'] = _float(appliance.logs.get('illuminance'))
+            elif appliance.type == TRV_TYPE and trv < MAX_TRVS:
+                trv += 1
+                data['trv_{}_battery'.format(trv)] = _float(
+                    appliance.logs.get('battery'))
+                data['trv_{}_current_temp'.format(trv)] = _float(
+                    appliance.logs.get('temperature'))
+
+        if ctrl_id is not None:
+            controller = self._controller_data(ctrl_id, ()) or {}
+            for key in ['boiler_temp'] + list(CONTROLLER_STATES.values()):
+                if key in controller:
+                    data[key] = controller[key]
+        return data
+
+    def _location_metadata(self, loc_id):
+        """Return the schedules and presets of a location, cached.
+
+        The cached lists and dicts are shared by the data of all refreshes
+        until they change, they are not to be modified.
+        """
+        metadata = self._metadata.get(loc_id)
+        if metadata is not None:
+            return metadata
+
+        schedules = self._rules_of(loc_id, SCHEDULE_TEMPLATE)
+        metadata = {
+            'available_schedules': [rule.name for _, rule in schedules],
+            'selected_schedule': None,
+            'last_used': None,
+        }
+        last_modified = None
+        for _, rule in schedules:
+            if rule.active:
+                metadata['selected_schedule'] = rule.name
+            if rule.modified and (last_modified is None
+                                  or _date(rule.modified) > _date(last_modified)):
+                last_modified = rule.modified
+                metadata['last_used'] = rule.name
+
+        metadata['presets'] = None
+        for _, rule in self._rules_of(loc_id, PRESET_TEMPLATE):
+            metadata['presets'] = dict(rule.presets)
+        self._metadata[loc_id] = metadata
+        return metadata
+
+    def _plug_data(self, plug_id):
+        """Return the data of a plug."""
+        plug = self._appliances.get(plug_id)
+        if plug is None:
+            return None
+        data = {'type': plug.type, 'relay': plug.relay}
+        for log_type in PLUG_MEASUREMENTS:
+            data[log_type] = _float(plug.logs.get(log_type))
+            data[log_type + '_interval'] = _float(plug.intervals.get(log_type))
+        return data
+
+
+class _Chunks:
+    """The chunks of a response, until the deadline has passed.
+
+    Keeps the time spent waiting for the chunks and their size.
+    """
+
+    def __init__(self, response, deadline):
+        """Iterate over the chunks of a response."""
+        self._chunks = response.iter_content(CHUNK_SIZE)
+        self._deadline = deadline
+        self.waited = 0
+        self.size = 0
+
+    def __iter__(self):
+        """Return the iterator."""
+        return self
+
+    def __next__(self):
+        """Return the next chunk."""
+        started = time.monotonic()
+        chunk = next(self._chunks)
+        now = time.monotonic()
+        self.waited += now - started
+        self.size += len(chunk)
+        if now > self._deadline:
+            raise TimeoutError(
+                "No complete response within {} seconds".format(DEADLINE))
+        return chunk
+
+
+def _size(response, chunks):
+    """Return the bytes received of a response, compressed when it was."""
+    try:
+        return response.raw.tell()
+    except AttributeError:
+        return chunks.size
+
+
+def _objects(chunks):
+    """Parse a response, yielding its top-level objects one at a time.
+
+    Each object is cleared once it has been used, so the document is never
+    held as a whole tree.
+    """
+    parser = Etree.XMLPullParser(events=('start', 'end'))
+    root = None
+    depth = 0
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if event == 'start':
+                    if root is None:
+                        root = element
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth == 1:
+                    yield element
+                    root.clear()
+        parser.close()
+    except Etree.ParseError as err:
+        raise RuntimeError("Invalid response from the gateway") from err
+
+
+def _escape_illegal_xml_characters(chunks):
+    """Escape the ampersands the gateway doesn't escape, chunk by chunk."""
+    pending = b''
+    for chunk in chunks:
+        chunk = pending + chunk
+        # An ampersand at the end depends on the first byte of the next chunk
+        if chunk.endswith(b'&'):
+            chunk, pending = chunk[:-1], b'&'
+        else:
+            pending = b''
+        yield ILLEGAL_AMPERSAND.sub(rb"&amp;\1", chunk)
+    if pending:
+        yield pending
+
+
+def _logs(element, log, wanted):
+    """Return the last measurements of the wanted logs of an element.
+
+    Measurements split by tariff are summed.
+    """
+    wanted = wanted[log]
+    logs = {}
+    for log_element in element.iterfind('logs/' + log):
+        log_type = log_element.findtext('type')
+        if log_type not in wanted:
+            continue
+        measurements = log_element.findall('period/measurement')
+        if len(measurements) == 1:
+            logs[log_type] = measurements[0].text
+        elif measurements:
+            logs[log_type] = sum(_float(measurement.text) or 0
+                                 for measurement in measurements)
+    return logs
+
+
+def _appliance(element, wanted):
+    """Return the record of an appliance, with the wanted logs."""
+    location = element.find('location')
+    return Appliance(
+        element.findtext('name'),
+        element.findtext('type'),
+        location.get('id') if location is not None else None,
+        _logs(element, 'point_log', wanted),
+        _logs(element, 'interval_log', wanted),
+        element.findtext('actuator_functionalities/relay_functionality/state'),
+        element.findtext('modified_date'),
+    )
+
+
+def _location(element, wanted):
+    """Return the record of a location, with the wanted logs."""
+    thermostat = element.find(
+        'actuator_functionalities/thermostat_functionality')
+    return Location(
+        element.findtext('name'),
+        element.findtext('type'),
+        element.findtext('preset'),
+        tuple(appliance.get('id')
+              for appliance in element.iterfind('appliances/appliance')),
+        thermostat.get('id') if thermostat is not None else None,
+        thermostat.findtext('setpoint') if thermostat is not None else None,
+        _logs(element, 'point_log', wanted),
+        element.findtext('modified_date'),
+    )
+
+
+def _rule(element, wanted):
+    """Return the record of a rule, which has no logs."""
+    template = element.find('template')
+    return Rule(
+        element.findtext('name'),
+        template.get('tag') if template is not None else None,
+        template.get('id') if template is not None else None,
+        element.findtext('active') == 'true',
+        frozenset(location.get('id')
+                  for location in element.iterfind('.//contexts//location')),
+        tuple((when.get('preset'), _float(then.get('setpoint')))
+              for when in element.iterfind('directives/when')
+              for then in when.iterfind('then')),
+        element.findtext('modified_date'),
+    )
+
+
+def _fingerprint(object_id, record):
+    """Return the hash of what makes a device of an object, 0 without."""
+    if isinstance(record, Appliance):
+        return hash((object_id, record.name, record.type,
+                     record.relay is not None))
+    if isinstance(record, Location):
+        return hash((object_id, record.name, record.thermostat is not None))
+    return 0
+
+
+RECORDS = {
+    'appliance': _appliance,
+    'location': _location,
+    'rule': _rule,
+}
+
+
+def _float(value):
+    """Return the value as float, None if it isn't a number."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _state(value):
+    """Return an on/off measurement as boolean."""
+    if value is None:
+        return None
+    return value == 'on'
+
+
+def _date(value):
+    """Parse a modified_date of the gateway."""
+    return datetime.fromisoformat(value)
@@ -0,0 +1,117 @@
+"""Recent power and energy readings of the plugs of an Adam.
+
+Each plug keeps its last readings in a ring buffer of fixed size: one array
+of timestamps and one array per field, so memory doesn't grow with the
+number of readings. The rolling average, peak and energy of a field are
+computed over the arrays when asked for, from the readings within a window.
+
+A reading holds until the next one, the gateway only reports changes. The
+buffer is sized to cover the window at the shortest poll interval, extra
+refreshes (after commands) can still push the oldest readings out of it:
+covers tells if the readings reach back to the start of the window.
+"""
+
+import math
+from array import array
+
+# Fields of the plug data kept, and those which are a power (W), of which
+# the energy (kWh) is integrated
+PLUG_FIELDS = (
+    "electricity_consumed",
+    "electricity_produced",
+    "electricity_consumed_interval",
+    "electricity_produced_interval",
+)
+POWER_FIELDS = ("electricity_consumed", "electricity_produced")
+
+# Minimum readings kept per plug, and the window of the statistics in
+# seconds
+HISTORY_SIZE = 240
+HISTORY_WINDOW = 3600
+
+
+def history_size(interval, window=HISTORY_WINDOW):
+    """Return the readings to keep to cover the window, polled every interval."""
+    return max(HISTORY_SIZE,
+               math.ceil(window / interval.total_seconds()) + 1)
+
+
+class PwRingBuffer:
+    """The last readings of a few fields, in arrays of fixed size."""
+
+    __slots__ = ("_times", "_values", "_next", "_count")
+
+    def __init__(self, fields=PLUG_FIELDS, size=HISTORY_SIZE):
+        """Initialize an empty buffer."""
+        self._times = array("d", [0.0]) * size
+        self._values = {field: array("d", [math.nan]) * size
+                        for field in fields}
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        """Return the number of readings."""
+        return self._count
+
+    def add(self, timestamp, data):
+        """Add the fields of the data read at a time (seconds).
+
+        A missing value is kept as NaN and skipped by the statistics.
+        """
+        index = self._next
+        self._times[index] = timestamp
+        for field, values in self._values.items():
+            value = data.get(field)
+            values[index] = math.nan if value is None else value
+        self._next = (index + 1) % len(self._times)
+        self._count = min(self._count + 1, len(self._times))
+
+    def covers(self, now, window=HISTORY_WINDOW):
+        """Return if the oldest reading is at or before the window start."""
+        if not self._count:
+            return False
+        oldest = self._times[self._next if self._count == len(self._times)
+                             else 0]
+        return oldest <= now - window
+
+    def statistics(self, field, now, window=HISTORY_WINDOW):
+        """Return the average, peak and integral (per second) of a field.
+
+        Over the readings within the window before now, each reading
+        holding until the next one. None when there are no readings.
+        """
+        times = self._ordered(self._times)
+        values = self._ordered(self._values[field])
+        start = now - window
+        # The last reading before the window holds into it
+        first = 0
+        for index in range(len(times) - 1, -1, -1):
+            if times[index] <= start:
+                first = index
+                break
+
+        times = times[first:]
+        values = values[first:]
+        ends = times[1:]
+        ends.append(now)
+        integral = 0.0
+        covered = 0.0
+        peak = None
+        for begin, end, value in zip(times, ends, values):
+            if math.isnan(value):
+                continue
+            duration = max(0.0, min(end, now) - max(begin, start))
+            integral += value * duration
+            covered += duration
+            if peak is None or value > peak:
+                peak = value
+        if peak is None:
+            return None
+        average = integral / covered if covered else peak
+        return average, peak, integral
+
+    def _ordered(self, values):
+        """Return the values of the readings, oldest first."""
+        if self._count < len(values):
+            return values[:self._count]
+        return values[self._next:] + values[:self._next]
@@ -0,0 +1,127 @@
+"""Profiler of the refreshes and commands of an Adam, for the profile service.
+
+While a hub is being profiled, each phase of its refreshes and commands runs
+under a CPU profiler of its own: the sync with the gateway (fetch and
+parse), the build of the snapshot, the entity updates and the commands.
+Memory allocations are traced over the whole profile. The reports are
+written under the config directory.
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+_LOGGER = logging.getLogger(__name__)
+
+PROFILE_DIR = "adam_profiles"
+PHASES = ("sync", "build", "entities", "commands")
+# Functions and allocation sites listed in a report
+TOP = 30
+# Frames kept of each traced allocation
+TRACE_FRAMES = 5
+
+# Profilers tracing allocations, tracing stops with the last one
+_tracing = 0
+_TRACING_LOCK = threading.Lock()
+
+
+class PwProfiler:
+    """Profile of the next refreshes or commands of a hub."""
+
+    def __init__(self, name, count):
+        """Start profiling (executor), for count refreshes or commands."""
+        self.name = name
+        self.remaining = count
+        self._count = count
+        self._profiles = {phase: cProfile.Profile() for phase in PHASES}
+        self._durations = dict.fromkeys(PHASES, 0.0)
+        self._calls = dict.fromkeys(PHASES, 0)
+        self._fetch = 0.0
+        self._parse = 0.0
+        self._started = time.strftime("%Y%m%d-%H%M%S")
+        global _tracing
+        with _TRACING_LOCK:
+            # Leave tracing started by others alone
+            if _tracing or not tracemalloc.is_tracing():
+                if not _tracing:
+                    tracemalloc.start(TRACE_FRAMES)
+                _tracing += 1
+                self._tracing = True
+            else:
+                self._tracing = False
+        self._snapshot = tracemalloc.take_snapshot()
+
+    def run(self, phase, job, *args):
+        """Run a job, profiled as part of a phase."""
+        started = time.perf_counter()
+        try:
+            return self._profiles[phase].runcall(job, *args)
+        finally:
+            self._durations[phase] += time.perf_counter() - started
+            self._calls[phase] += 1
+
+    def add_sync(self, sync):
+        """Add the fetch and parse time of a sync with the gateway."""
+        if sync is not None:
+            self._fetch += sync.fetch
+            self._parse += sync.parse
+
+    def done(self):
+        """Count a refresh or command, return if the profile is complete."""
+        self.remaining -= 1
+        return self.remaining <= 0
+
+    def report(self, config_dir):
+        """Stop profiling and write the reports (executor).
+
+        Return the path of the summary.
+        """
+        snapshot = tracemalloc.take_snapshot()
+        global _tracing
+        with _TRACING_LOCK:
+            if self._tracing:
+                _tracing -= 1
+                if not _tracing:
+                    tracemalloc.stop()
+
+        directory = os.path.join(config_dir, PROFILE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, "{}-{}".format(self.name, self._started))
+
+        out = io.StringIO()
+        out.write("Profile of Adam {}, {} refreshes or commands from {}\n\n"
+                  .format(self.name, self._count - max(self.remaining, 0),
+                          self._started))
+        out.write("{:<10} {:>8} {:>12}\n".format("phase", "calls", "seconds"))
+        for phase in PHASES:
+            out.write("{:<10} {:>8} {:>12.4f}\n".format(
+                phase, self._calls[phase], self._durations[phase]))
+            if phase == "sync":
+                out.write("{:<10} {:>8} {:>12.4f}\n".format(
+                    "  fetch", "", self._fetch))
+                out.write("{:<10} {:>8} {:>12.4f}\n".format(
+                    "  parse", "", self._parse))
+
+        for phase in PHASES:
+            if not self._calls[phase]:
+                continue
+            profile = self._profiles[phase]
+            profile.dump_stats("{}-{}.prof".format(stem, phase))
+            out.write("\n\nCPU profile of {}, by cumulative time\n\n".format(
+                phase))
+            stats = pstats.Stats(profile, stream=out)
+            stats.strip_dirs().sort_stats("cumulative").print_stats(TOP)
+
+        out.write("\n\nAllocations since the start, by line\n\n")
+        for stat in snapshot.compare_to(self._snapshot, "lineno")[:TOP]:
+            out.write("{}\n".format(stat))
+
+        path = stem + ".txt"
+        with open(path, "w") as report:
+            report.write(out.getvalue())
+        return path
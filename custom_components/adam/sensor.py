@@ -1,23 +1,33 @@
 """Plugwise Sensor component for HomeAssistant."""
 
 import logging
-import plugwise
+import time
+
+import homeassistant.util.dt as dt_util
 
 from . import (
     DOMAIN,
     DATA_ADAM,
+    SIGNAL_DIAGNOSTICS_ADAM,
     PwEntity,
 )
+from .history import PLUG_FIELDS, POWER_FIELDS
 
-#from homeassistant.helpers.entity import Entity
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import async_call_later
 from homeassistant.const import (
+    CONF_NAME,
     ATTR_BATTERY_LEVEL,
     ATTR_TEMPERATURE,
+    DATA_BYTES,
     DEVICE_CLASS_BATTERY,
     DEVICE_CLASS_ILLUMINANCE,
     DEVICE_CLASS_POWER,
     DEVICE_CLASS_PRESSURE,
     DEVICE_CLASS_TEMPERATURE,
+    DEVICE_CLASS_TIMESTAMP,
     ENERGY_WATT_HOUR,
     POWER_WATT,
     PRESSURE_MBAR,
@@ -26,32 +36,89 @@ from homeassistant.const import (
 
 _LOGGER = logging.getLogger(__name__)
 
+# Sensor type: unit, icon, device class
 SENSOR_TYPES = {
-    ATTR_TEMPERATURE : [TEMP_CELSIUS, None, DEVICE_CLASS_TEMPERATURE],
-    ATTR_BATTERY_LEVEL : ["%" , None, DEVICE_CLASS_BATTERY],
-    "illuminance" : ["lm" , None, DEVICE_CLASS_ILLUMINANCE],
-    "pressure" : [PRESSURE_MBAR , None, DEVICE_CLASS_PRESSURE],
-    "energy_flow" : [POWER_WATT , None, DEVICE_CLASS_POWER ],
-    "energy_measured" : [ENERGY_WATT_HOUR , None, DEVICE_CLASS_POWER ],
+    ATTR_TEMPERATURE : [TEMP_CELSIUS, "mdi:thermometer", DEVICE_CLASS_TEMPERATURE],
+    ATTR_BATTERY_LEVEL : ["%" , "mdi:water-battery", DEVICE_CLASS_BATTERY],
+    "illuminance" : ["lm" , "mdi:lightbulb-on-outline", DEVICE_CLASS_ILLUMINANCE],
+    "pressure" : [PRESSURE_MBAR , "mdi:water", DEVICE_CLASS_PRESSURE],
+    "energy_flow" : [POWER_WATT , "mdi:flash", DEVICE_CLASS_POWER ],
+    "energy_measured" : [ENERGY_WATT_HOUR , "mdi:flash", DEVICE_CLASS_POWER ],
 }
 
+# Statistics of the plug readings of the last hour
+ATTR_AVERAGE = "average"
+ATTR_PEAK = "peak"
+ATTR_ENERGY = "energy_kwh"
+
+# Changes smaller than this are not written, unless the state got too old
+SENSOR_DEADBAND = {
+    ATTR_TEMPERATURE : 0.1,
+    ATTR_BATTERY_LEVEL : 1,
+    "illuminance" : 5,
+    "pressure" : 0.05,
+    "energy_flow" : 5,
+    "energy_measured" : 0,
+}
+
+
+def _percentage(value):
+    """Convert a fraction (0 - 1) to a percentage."""
+    return int(round(float(value) * 100))
+
+
+# Sensor: sensor type, key in the device data, converter of the value
 SENSOR_AVAILABLE = {
-    "boiler_temperature": ATTR_TEMPERATURE,
-    "trv_1_current_temperature": ATTR_TEMPERATURE,
-    "trv_2_current_temperature": ATTR_TEMPERATURE,
-    "trv_3_current_temperature": ATTR_TEMPERATURE,
-    "water_pressure": "pressure",
-    "battery_charge": ATTR_BATTERY_LEVEL,
-    "trv_1_battery_charge": ATTR_BATTERY_LEVEL,
-    "trv_2_battery_charge": ATTR_BATTERY_LEVEL,
-    "trv_3_battery_charge": ATTR_BATTERY_LEVEL,
-    "outdoor_temperature": ATTR_TEMPERATURE,
-    "illuminance": "illuminance",
-    "electricity_consumed": "energy_flow",
-    "electricity_consumed_interval": "energy_measured",
-    "electricity_produced": "energy_flow",
-    "electricity_produced_interval": "energy_measured",
+    "boiler_temperature": [ATTR_TEMPERATURE, "boiler_temp", None],
+    "trv_1_current_temperature": [ATTR_TEMPERATURE, "trv_1_current_temp", None],
+    "trv_2_current_temperature": [ATTR_TEMPERATURE, "trv_2_current_temp", None],
+    "trv_3_current_temperature": [ATTR_TEMPERATURE, "trv_3_current_temp", None],
+    "water_pressure": ["pressure", "water_pressure", None],
+    "battery_charge": [ATTR_BATTERY_LEVEL, "battery", _percentage],
+    "trv_1_battery_charge": [ATTR_BATTERY_LEVEL, "trv_1_battery", _percentage],
+    "trv_2_battery_charge": [ATTR_BATTERY_LEVEL, "trv_2_battery", _percentage],
+    "trv_3_battery_charge": [ATTR_BATTERY_LEVEL, "trv_3_battery", _percentage],
+    "outdoor_temperature": [ATTR_TEMPERATURE, "outdoor_temp", None],
+    "illuminance": ["illuminance", "illuminance", None],
+    "electricity_consumed": ["energy_flow", "electricity_consumed", None],
+    "electricity_consumed_interval": ["energy_measured", "electricity_consumed_interval", None],
+    "electricity_produced": ["energy_flow", "electricity_produced", None],
+    "electricity_produced_interval": ["energy_measured", "electricity_produced_interval", None],
+}
+
 
+def _milliseconds(seconds):
+    """Convert a duration to milliseconds."""
+    if seconds is None:
+        return None
+    return round(seconds * 1000)
+
+
+def _timestamp(date):
+    """Convert a date to a timestamp state."""
+    if date is None:
+        return None
+    return date.isoformat()
+
+
+# Diagnostic sensor: unit, icon, device class, its value from the hub stats
+DIAGNOSTIC_SENSORS = {
+    "fetch_duration": ["ms", "mdi:timer-outline", None,
+                       lambda stats: _milliseconds(stats.fetch)],
+    "parse_duration": ["ms", "mdi:timer-outline", None,
+                       lambda stats: _milliseconds(stats.parse)],
+    "bytes_received": [DATA_BYTES, "mdi:download", None,
+                       lambda stats: stats.size],
+    "entities_updated": [None, "mdi:pencil", None,
+                         lambda stats: stats.updated],
+    "writes_suppressed": [None, "mdi:pencil-off", None,
+                          lambda stats: stats.suppressed],
+    "failed_polls": [None, "mdi:alert-circle-outline", None,
+                     lambda stats: stats.failed],
+    "last_response": [None, "mdi:clock-outline", DEVICE_CLASS_TIMESTAMP,
+                      lambda stats: _timestamp(stats.last_response)],
+    "command_duration": ["ms", "mdi:timer-outline", None,
+                         lambda stats: _milliseconds(stats.command)],
 }
 
 def setup_platform(hass, config, add_entities, discovery_info=None):
@@ -60,257 +127,232 @@ def setup_platform(hass, config, add_entities, discovery_info=None):
     if discovery_info is None:
         return
 
-    api = hass.data[DATA_ADAM].data
+    hub = hass.data[DATA_ADAM][discovery_info[CONF_NAME]]
+    hub.add_platform(_create_entities, add_entities)
 
-    devices = []
-    ctrl_id = None
-    try:
-        devs = api.get_devices()
-    except RuntimeError:
-        _LOGGER.error("Unable to get location info from the API")
-        return
+    if hub.diagnostics:
+        add_entities(
+            [PwDiagnosticSensor(hub, sensor) for sensor in DIAGNOSTIC_SENSORS],
+            True)
 
-    _LOGGER.info('Dev %s', devs)
-    
-    ctrl_temp = None
+
+def _create_entities(hub, devs):
+    """Return the sensors of the devices."""
+    devices = []
     for dev in devs:
-        data = None
-        _LOGGER.info('Dev %s', dev)
-        if dev['name'] == 'Controlled Device':
-            dev_id =  None
-            ctrl_id = dev['id']
-            ctrl_temp = ctrl_id
-            plug_id = None
-            name = 'adam'
-            _LOGGER.info('Name %s', name)
-            _LOGGER.info('dev_id %s', dev_id)
-            _LOGGER.info('ctrl_id %s', ctrl_id)
-            _LOGGER.info('plug_id %s', plug_id)
-            data = api.get_device_data(dev_id, ctrl_id, plug_id)
-        if dev['type'] == 'thermostat':
-            dev_id = dev['id']
-            ctrl_id = ctrl_temp
-            plug_id = None
-            name = dev['name']
-            _LOGGER.info('Name %s', name)
-            data = api.get_device_data(dev_id, ctrl_id, plug_id)
-        if dev['type'] == 'plug':
-            dev_id = None
-            ctrl_id = None
-            plug_id = dev['id']
-            name = dev['name']
-            _LOGGER.info('Name %s', name)
-            data = api.get_device_data(dev_id, ctrl_id, plug_id)
+        dev_id, ctrl_id, plug_id = dev.key
+        name = hub.entity_name(dev.name)
+        data = hub.snapshot.get(dev.key)
 
         if data is None:
             _LOGGER.debug("Received no data for device %s.", name)
             #return
         else:
             _LOGGER.debug("Device data %s.", data)
-            for sensor,sensor_type in SENSOR_AVAILABLE.items():
-                addSensor=False
-                if sensor == 'boiler_temperature':
-                    if 'boiler_temp' in data:
-                        if data['boiler_temp']:
-                            addSensor=True
-                if sensor == 'water_pressure':
-                    if 'water_pressure' in data:
-                        if data['water_pressure']:
-                            addSensor=True
-                if sensor == 'battery_charge':
-                    if 'battery' in data:
-                        if data['battery']:
-                            addSensor=True
-                if sensor == 'trv_1_battery_charge':
-                    if 'trv_1_battery' in data:
-                        if data['trv_1_battery']:
-                            addSensor=True
-                if sensor == 'trv_2_battery_charge':
-                    if 'trv_2_battery' in data:
-                        if data['trv_2_battery']:
-                            addSensor=True
-                if sensor == 'trv_3_battery_charge':
-                    if 'trv_3_battery' in data:
-                        if data['trv_3_battery']:
-                            addSensor=True
-                if sensor == 'trv_1_current_temperature':
-                    if 'trv_1_current_temp' in data:
-                        if data['trv_1_current_temp']:
-                            addSensor=True
-                if sensor == 'trv_2_current_temperature':
-                    if 'trv_2_current_temp' in data:
-                        if data['trv_2_current_temp']:
-                            addSensor=True
-                if sensor == 'trv_3_current_temperature':
-                    if 'trv_3_current_temp' in data:
-                        if data['trv_3_current_temp']:
-                            addSensor=True
-                if sensor == 'outdoor_temperature':
-                    if 'outdoor_temp' in data:
-                        if data['outdoor_temp']:
-                            addSensor=True
-                if sensor == 'illuminance':
-                    if 'illuminance' in data:
-                        if data['illuminance']:
-                            addSensor=True
-                if sensor == 'electricity_consumed':
-                    if 'electricity_consumed' in data:
-                        if data['electricity_consumed']:
-                            addSensor=True
-                if sensor == 'electricity_consumed_interval':
-                    if 'electricity_consumed_interval' in data:
-                        if data['electricity_consumed_interval']:
-                            addSensor=True
-                if sensor == 'electricity_produced':
-                    if 'electricity_produced' in data:
-                        if data['electricity_produced']:
-                            addSensor=True
-                if sensor == 'electricity_produced_interval':
-                    if 'electricity_produced_interval' in data:
-                        if data['electricity_produced_interval']:
-                            addSensor=True
-                if addSensor:
+            for sensor, (sensor_type, key, _) in SENSOR_AVAILABLE.items():
+                if data.get(key):
                     _LOGGER.info('Adding sensor.%s', '{}_{}'.format(name, sensor))
-                    devices.append(PwThermostatSensor(api,'{}_{}'.format(name, sensor), dev_id, ctrl_id, plug_id, sensor, sensor_type))
-                    
-    _LOGGER.info('Adding entities:', devices)
-    add_entities(devices, True)
+                    devices.append(PwThermostatSensor(hub,'{}_{}'.format(name, sensor), dev_id, ctrl_id, plug_id, sensor, sensor_type))
+    return devices
 
 
 class PwThermostatSensor(PwEntity):
     """Representation of a Plugwise thermostat sensor."""
 
-    def __init__(self, api, name, dev_id, ctlr_id, plug_id, sensor, sensor_type):
+    __slots__ = ('_name', '_sensor', '_sensor_type', '_data_key', '_convert',
+                 '_unit', '_icon', '_device_class', '_deadband', '_max_age',
+                 '_written_state', '_written_at', '_unsub_heartbeat')
+
+    def __init__(self, hub, name, dev_id, ctlr_id, plug_id, sensor, sensor_type):
         """Set up the Plugwise API."""
-        self._api = api
+        super().__init__(hub, dev_id, ctlr_id, plug_id)
         self._name = name
-        self._dev_id = dev_id
-        self._ctrl_id = ctlr_id
-        self._plug_id = plug_id
-        self._device = sensor_type[2]
         self._sensor = sensor
         self._sensor_type = sensor_type
-        self._state = None
+        _, self._data_key, self._convert = SENSOR_AVAILABLE[sensor]
+        self._unit, self._icon, self._device_class = SENSOR_TYPES[sensor_type]
+        self._deadband = hub.deadband.get(sensor_type, SENSOR_DEADBAND[sensor_type])
+        self._max_age = hub.max_age
+        self._written_state = None
+        self._written_at = None
+        self._unsub_heartbeat = None
 
     @property
     def name(self):
         """Return the name of the thermostat, if any."""
         return self._name
 
+    @property
+    def unique_id(self):
+        """Return the ids of the device and the sensor."""
+        return '{}-{}'.format(super().unique_id, self._sensor)
+
     @property
     def state(self):
         """Return the state of the sensor."""
-        return self._state
+        value = self._get(self._data_key)
+        if value is None or self._convert is None:
+            return value
+        return self._convert(value)
+
+    def _should_write(self):
+        """Write significant changes, and at least every max_age.
+
+        A suppressed change is written by a heartbeat max_age after the last
+        written state, when no other change is written before.
+        """
+        now = dt_util.utcnow()
+        state = self.state
+        try:
+            change = abs(float(state) - float(self._written_state))
+        except (TypeError, ValueError):
+            change = None
+        if (change is not None and round(change, 6) < self._deadband
+                and now - self._written_at < self._max_age):
+            _LOGGER.debug("Suppressed state %s of %s", state, self._name)
+            if self._unsub_heartbeat is None:
+                self._unsub_heartbeat = async_call_later(
+                    self.hass,
+                    (self._written_at + self._max_age - now).total_seconds(),
+                    self._heartbeat)
+            return False
+        self._cancel_heartbeat()
+        self._written_state = state
+        self._written_at = now
+        return True
+
+    @callback
+    def _heartbeat(self, _now):
+        """Write the state suppressed since the last written state."""
+        self._unsub_heartbeat = None
+        self._hub.profiled('entities', self._update_state)
+
+    def _cancel_heartbeat(self):
+        """Cancel the pending heartbeat, if any."""
+        if self._unsub_heartbeat is not None:
+            self._unsub_heartbeat()
+            self._unsub_heartbeat = None
+
+    async def async_will_remove_from_hass(self):
+        """Disconnect from the hub and cancel the heartbeat."""
+        await super().async_will_remove_from_hass()
+        self._cancel_heartbeat()
+
+    def _fields(self):
+        """Return the field of the device data of the sensor."""
+        return (self._data_key,)
 
     @property
     def device_class(self):
         """Device class of this entity."""
-        if self._sensor_type == "temperature":
-            return DEVICE_CLASS_TEMPERATURE
-        if self._sensor_type == "battery_level":
-            return DEVICE_CLASS_BATTERY
-        if self._sensor_type == "illuminance":
-            return DEVICE_CLASS_ILLUMINANCE
-        if self._sensor_type == "pressure":
-            return DEVICE_CLASS_PRESSURE
-        if self._sensor_type == "energy_flow" or self._sensor_type == "energy_measured":
-            return DEVICE_CLASS_POWER
-
-#    @property
-#    def device_state_attributes(self):
-#        """Return the state attributes."""
-#        return self._state_attributes
+        return self._device_class
+
+    @property
+    def device_state_attributes(self):
+        """Return the average and peak of the last hour, for plugs.
+
+        Of a power also the energy of the last hour, once the readings
+        cover the hour.
+        """
+        if self._data_key not in PLUG_FIELDS:
+            return None
+        history = self._hub.history.get(self._key)
+        if history is None:
+            return None
+        now = time.monotonic()
+        statistics = history.statistics(self._data_key, now)
+        if statistics is None:
+            return None
+        average, peak, integral = statistics
+        attributes = {
+            ATTR_AVERAGE: round(average, 1),
+            ATTR_PEAK: round(peak, 1),
+        }
+        if self._data_key in POWER_FIELDS and history.covers(now):
+            # Ws to kWh
+            attributes[ATTR_ENERGY] = round(integral / 3600000, 3)
+        return attributes
 
     @property
     def unit_of_measurement(self):
         """Return the unit of measurement."""
-        if self._sensor_type == "temperature":
-            return self.hass.config.units.temperature_unit
-        if self._sensor_type == "battery_level":
-            return "%"
-        if self._sensor_type == "illuminance":
-            return "lm"
-        if self._sensor_type == "pressure":
-            return PRESSURE_MBAR
-        if self._sensor_type == "energy_flow":
-            return POWER_WATT
-        if self._sensor_type == "energy_measured":
-            return ENERGY_WATT_HOUR
+        return self._unit
+
+    @property
+    def icon(self):
+        """Icon for the sensor."""
+        return self._icon
+
 
+class PwDiagnosticSensor(Entity):
+    """Representation of a diagnostic sensor of the refreshes of a hub.
+
+    It stays available when the gateway isn't, to show the failed polls.
+    """
+
+    def __init__(self, hub, sensor):
+        """Set up the diagnostic sensor."""
+        self._hub = hub
+        self._name = '{}_{}'.format(hub.name, sensor)
+        self._sensor = sensor
+        self._unit, self._icon, self._device_class, self._value = (
+            DIAGNOSTIC_SENSORS[sensor])
+        self._state = None
+        self._unsub_dispatcher = None
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def unique_id(self):
+        """Return the name of the hub and the sensor."""
+        return '{}-{}'.format(self._hub.name, self._sensor)
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def should_poll(self):
+        """No polling needed, the hub pushes new data."""
+        return False
+
+    @property
+    def device_class(self):
+        """Device class of this entity."""
+        return self._device_class
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return self._unit
 
     @property
     def icon(self):
         """Icon for the sensor."""
-        if self._sensor_type == "temperature":
-            return "mdi:thermometer"
-        if self._sensor_type == "battery_level":
-            return "mdi:water-battery"
-        if self._sensor_type == "illuminance":
-            return "mdi:lightbulb-on-outline"
-        if self._sensor_type == "pressure":
-            return "mdi:water"
-        if self._sensor_type == "energy_flow" or self._sensor_type == "energy_measured":
-            return "mdi:flash"
+        return self._icon
 
-    def update(self):
-        """Update the data from the thermostat."""
-        _LOGGER.debug("Update sensor called")
-        data = self._api.get_device_data(self._dev_id, self._ctrl_id, self._plug_id)
+    async def async_added_to_hass(self):
+        """Register callbacks."""
+        self._unsub_dispatcher = async_dispatcher_connect(
+            self.hass, SIGNAL_DIAGNOSTICS_ADAM.format(self._hub.name),
+            self._update_callback)
 
-        if data is None:
-            _LOGGER.debug("Received no data for device %s.", self._name)
-        else:
-            if self._sensor == 'boiler_temperature':
-                if 'boiler_temp' in data:
-                    self._state = data['boiler_temp']
-            if self._sensor == 'water_pressure':
-                if 'water_pressure' in data:
-                    self._state = data['water_pressure']
-            if self._sensor == 'battery_charge':
-                if 'battery' in data:
-                    if data['battery']:
-                        value = float(data['battery'])
-                        self._state = int(round(value * 100))
-            if self._sensor == 'trv_1_battery_charge':
-                if 'trv_1_battery' in data:
-                    if data['trv_1_battery']:
-                        value = float(data['trv_1_battery'])
-                        self._state = int(round(value * 100))
-            if self._sensor == 'trv_2_battery_charge':
-                if 'trv_2_battery' in data:
-                    if data['trv_2_battery']:
-                        value = float(data['trv_2_battery'])
-                        self._state = int(round(value * 100))
-            if self._sensor == 'trv_3_battery_charge':
-                if 'trv_3_battery' in data:
-                    if data['trv_3_battery']:
-                        value = float(data['trv_3_battery'])
-                        self._state = int(round(value * 100))
-            if self._sensor == 'trv_1_current_temperature':
-                if 'trv_1_current_temp' in data:
-                        self._state = data['trv_1_current_temp']
-            if self._sensor == 'trv_2_current_temperature':
-                if 'trv_2_current_temp' in data:
-                        self._state = data['trv_2_current_temp']
-            if self._sensor == 'trv_3_current_temperature':
-                if 'trv_3_current_temp' in data:
-                        self._state = data['trv_3_current_temp']
-            if self._sensor == 'outdoor_temperature':
-                if 'outdoor_temp' in data:
-                    self._state = data['outdoor_temp']
-            if self._sensor == 'illuminance':
-                if 'illuminance' in data:
-                    self._state = data['illuminance']
-            if self._sensor == 'electricity_consumed':
-                if 'electricity_consumed' in data:
-                    self._state = data['electricity_consumed']
-            if self._sensor == 'electricity_consumed_interval':
-                if 'electricity_consumed_interval' in data:
-                    self._state = data['electricity_consumed_interval']
-            if self._sensor == 'electricity_produced':
-                if 'electricity_produced' in data:
-                    self._state = data['electricity_produced']
-            if self._sensor == 'electricity_produced_interval':
-                if 'electricity_produced_interval' in data:
-                    self._state = data['electricity_produced_interval']
+    async def async_will_remove_from_hass(self):
+        """Disconnect from the hub."""
+        if self._unsub_dispatcher is not None:
+            self._unsub_dispatcher()
+            self._unsub_dispatcher = None
 
+    @callback
+    def _update_callback(self):
+        """Update from the hub stats and write the state."""
+        self.update()
+        self.async_write_ha_state()
+
+    def update(self):
+        """Update the sensor from the hub stats."""
+        self._state = self._value(self._hub.stats)
@@ -1,11 +1,14 @@
 """Plugwise Water Heater component for HomeAssistant."""
 
 import logging
-import plugwise
+
+from homeassistant.const import CONF_NAME
+from homeassistant.core import callback
 
 from . import (
     DOMAIN,
     DATA_ADAM,
+    ATTR_RELAY,
     PwEntity,
 )
 
@@ -21,67 +24,72 @@ def setup_platform(hass, config, add_entities, discovery_info=None):
     if discovery_info is None:
         return
 
-    api = hass.data[DATA_ADAM].data
+    hub = hass.data[DATA_ADAM][discovery_info[CONF_NAME]]
+    hub.add_platform(_create_entities, add_entities)
 
-    devices = []
-    ctrl_id = None
-    try:
-        devs = api.get_devices()
-    except RuntimeError:
-        _LOGGER.error("Unable to get location info from the API")
-        return
 
-    _LOGGER.info('Dev %s', devs)
+def _create_entities(hub, devs):
+    """Return the plugs of the devices."""
+    devices = []
     for dev in devs:
-        data = None
-        _LOGGER.info('Dev %s', dev)
-        if dev['type'] == 'plug':
-            plug_id = dev['id']
-            plug_type = dev['type']
-            name = dev['name']
-            _LOGGER.info('Name %s', name)
-            data = data = api.get_device_data(None, None, plug_id)
-
-            if data is None:
-                _LOGGER.debug("Received no data for device %s.", name)
-            else:
-                device = PwSwitch(api, name, plug_type, plug_id)
-                _LOGGER.info('Adding switch.%s', name)
-                if not device:
-                    continue
-                devices.append(device)
-    add_entities(devices, True)
+        plug_id = dev.plug_id
+        if plug_id is None:
+            continue
+        name = hub.entity_name(dev.name)
+        data = hub.snapshot.get(dev.key)
+
+        if data is None:
+            _LOGGER.debug("Received no data for device %s.", name)
+        else:
+            device = PwSwitch(hub, name, 'plug', plug_id)
+            _LOGGER.info('Adding switch.%s', name)
+            devices.append(device)
+    return devices
 
 
 class PwSwitch(PwEntity, SwitchDevice):
     """Representation of a Plugwise plug."""
 
-    def __init__(self, api, name, plug_type, plug_id):
+    FIELDS = ('type', 'relay')
+
+    __slots__ = ('_name', '_plug_id')
+
+    def __init__(self, hub, name, plug_type, plug_id):
         """Set up the Plugwise API."""
-        self._api = api
+        super().__init__(hub, None, None, plug_id)
         self._name = name
         self._plug_id = plug_id
-        self._plug_type = None
-        self._device_is_on = False
 
     @property
     def is_on(self):
         """Return true if device is on."""
-        return self._device_is_on
+        return self._get('relay') == 'on'
 
-    def turn_on(self, **kwargs):
+    async def async_turn_on(self, **kwargs):
         """Turn the device on."""
-        _LOGGER.debug("Turn switch.%s on.", self._name)
-        self._api.set_relay_state(self._plug_id, self._plug_type, 'on')
-        self._api.get_domain_objects()
-        self._api.get_appliances()
+        self._set_relay('on')
+        self.async_write_ha_state()
 
-    def turn_off(self, **kwargs):
+    async def async_turn_off(self, **kwargs):
         """Turn the device off."""
-        _LOGGER.debug("Turn switch.%s off.", self._name)
-        self._api.set_relay_state(self._plug_id, self._plug_type, 'off')
-        self._api.get_domain_objects()
-        self._api.get_appliances()
+        self._set_relay('off')
+        self.async_write_ha_state()
+
+    @callback
+    def async_bulk_set(self, values):
+        """Queue the relay state of a bulk set."""
+        if ATTR_RELAY in values:
+            self._set_relay('on' if values[ATTR_RELAY] else 'off')
+            self.async_write_ha_state()
+
+    @callback
+    def _set_relay(self, state):
+        """Queue switching the relay on or off."""
+        _LOGGER.debug("Turn switch.%s %s.", self._name, state)
+        self._hub.async_queue_command(
+            self._key, 'relay', self._api.set_relay_state,
+            self._plug_id, self._get('type'), state)
+        self._set_optimistic('relay', state)
 
     @property
     def name(self):
@@ -93,17 +101,3 @@ class PwSwitch(PwEntity, SwitchDevice):
         """Return the icon to use in the frontend."""
         return SWITCH_ICON
 
-    def update(self):
-        """Update the data from the Plugs."""
-        _LOGGER.debug("Update switch called")
-
-        data = self._api.get_device_data(None, None, self._plug_id)
-
-        if data is None:
-            _LOGGER.debug("Received no data for device %s.", self._name)
-        else:
-            if 'relay' in data:
-                self._plug_type = data['type']
-                self._device_is_on = (data['relay'] == 'on')
-                _LOGGER.debug("Switch is ON is %s.", self._device_is_on)
-
@@ -1,7 +1,8 @@
 """Plugwise Water Heater component for HomeAssistant."""
 
 import logging
-import plugwise
+
+from homeassistant.const import CONF_NAME
 
 from . import (
     DOMAIN,
@@ -26,52 +27,43 @@ def setup_platform(hass, config, add_entities, discovery_info=None):
     if discovery_info is None:
         return
 
-    api = hass.data[DATA_ADAM].data
+    hub = hass.data[DATA_ADAM][discovery_info[CONF_NAME]]
+    hub.add_platform(_create_entities, add_entities)
 
-    devices = []
-    ctrl_id = None
-    try:
-        devs = api.get_devices()
-    except RuntimeError:
-        _LOGGER.error("Unable to get location info from the API")
-        return
 
-    _LOGGER.info('Dev %s', devs)
+def _create_entities(hub, devs):
+    """Return the water heater of the controller among the devices."""
+    devices = []
     for dev in devs:
-        data = None
-        _LOGGER.info('Dev %s', dev)
-        if dev['name'] == 'Controlled Device':
-            ctrl_id = dev['id']
-            dev_id = None
-            name = 'adam'
-            _LOGGER.info('Name %s', name)
-            data = api.get_device_data(dev_id, ctrl_id, None)
-
-            if data is None:
-                _LOGGER.debug("Received no data for device %s.", name)
-                return
-
-            device = PwWaterHeater(api, name, dev_id, ctrl_id)
-            _LOGGER.info('Adding water_heater.%s', name)
-            if not device:
-                continue
-            devices.append(device)
-    add_entities(devices, True)
+        if dev.ctrl_id is None or dev.dev_id is not None:
+            continue
+        name = hub.entity_name(dev.name)
+        data = hub.snapshot.get(dev.key)
+
+        if data is None:
+            _LOGGER.debug("Received no data for device %s.", name)
+            continue
+
+        device = PwWaterHeater(hub, name, dev.dev_id, dev.ctrl_id)
+        _LOGGER.info('Adding water_heater.%s', name)
+        devices.append(device)
+    return devices
 
 
 class PwWaterHeater(PwEntity):
     """Representation of a Plugwise water_heater."""
 
-    def __init__(self, api, name, dev_id, ctlr_id):
+    FIELDS = (
+        'central_heating_state', 'boiler_state', 'dhw_state', 'cooling_state')
+
+    __slots__ = ('_name', '_dev_id', '_ctrl_id')
+
+    def __init__(self, hub, name, dev_id, ctlr_id):
         """Set up the Plugwise API."""
-        self._api = api
+        super().__init__(hub, dev_id, ctlr_id, None)
         self._name = name
         self._dev_id = dev_id
         self._ctrl_id = ctlr_id
-        self._cooling_status = None
-        self._heating_status =  None 
-        self._boiler_status = None
-        self._dhw_status = None
 
     @property
     def name(self):
@@ -81,11 +73,11 @@ class PwWaterHeater(PwEntity):
     @property
     def state(self):
         """Return the state of the sensor."""
-        if self._heating_status or self._boiler_status:
+        if self._get('central_heating_state') or self._get('boiler_state'):
             return CURRENT_HVAC_HEAT
-        if self._dhw_status:
+        if self._get('dhw_state'):
             return CURRENT_HVAC_DHW
-        if self._cooling_status:
+        if self._get('cooling_state'):
             return CURRENT_HVAC_COOL
         return CURRENT_HVAC_IDLE
 
@@ -93,20 +85,3 @@ class PwWaterHeater(PwEntity):
     def icon(self):
         """Return the icon to use in the frontend."""
         return WATER_HEATER_ICON
-
-    def update(self):
-        """Update the data from the water_heater."""
-        _LOGGER.debug("Update water_heater called")
-        data = self._api.get_device_data(self._dev_id, self._ctrl_id, None)
-
-        if data is None:
-            _LOGGER.debug("Received no data for device %s.", self._name)
-        else:
-            if 'central_heating_state' in data:
-                self._heating_status =  data['central_heating_state'] 
-            if 'boiler_state' in data:
-                self._boiler_status = data['boiler_state']
-            if 'cooling_state' in data:
-                self._cooling_status = data['cooling_state'] 
-            if 'dhw_state' in data:
-                self._dhw_status = data['dhw_state'] 
@@ -0,0 +1,110 @@
+"""Tests of the columnar store of the device data."""
+
+import unittest
+
+from custom_components.adam.columns import PwColumns, slots
+
+THERMOSTAT = ("loc", "ctrl", None)
+PLUG = (None, None, "plug")
+NEW_PLUG = (None, None, "new")
+
+THERMOSTAT_DATA = {
+    "type": "livingroom",
+    "setpoint_temp": 21.0,
+    "current_temp": 20.5,
+    "battery": None,
+    "boiler_state": True,
+    "selected_schedule": "Werkdagen",
+}
+PLUG_DATA = {
+    "type": "refrigerator",
+    "relay": "on",
+    "electricity_consumed": 58.4,
+}
+
+
+class ColumnsTest(unittest.TestCase):
+    """Building, reading and comparing stores."""
+
+    def setUp(self):
+        """Build a store of a thermostat and a plug."""
+        self.layout = slots((THERMOSTAT, PLUG))
+        self.store = PwColumns(
+            self.layout, ((THERMOSTAT, THERMOSTAT_DATA), (PLUG, PLUG_DATA)))
+
+    def test_rows(self):
+        """A row reads as the data of its device."""
+        self.assertEqual(dict(self.store[THERMOSTAT]), THERMOSTAT_DATA)
+        self.assertEqual(dict(self.store[PLUG]), PLUG_DATA)
+        row = self.store[PLUG]
+        self.assertNotIn("setpoint_temp", row)
+        self.assertIsNone(row.get("setpoint_temp"))
+        self.assertIn("battery", self.store[THERMOSTAT])
+
+    def test_no_data(self):
+        """A device without data has no row."""
+        store = PwColumns(self.layout, ((THERMOSTAT, None), (PLUG, PLUG_DATA)))
+        self.assertIsNone(store[THERMOSTAT])
+        self.assertEqual(store.diff(self.store), {
+            THERMOSTAT: set(THERMOSTAT_DATA)})
+
+    def test_diff(self):
+        """Only the changed fields of the changed devices are reported."""
+        data = dict(THERMOSTAT_DATA, current_temp=20.7, boiler_state=False,
+                    selected_schedule=None)
+        store = PwColumns(
+            self.layout, ((THERMOSTAT, data), (PLUG, dict(PLUG_DATA))))
+        self.assertEqual(store.diff(self.store), {
+            THERMOSTAT: {"current_temp", "boiler_state", "selected_schedule"}})
+        self.assertEqual(store.diff(store), {})
+
+    def test_diff_missing_values(self):
+        """Missing values (NaN) compare equal, a value appearing changes."""
+        store = PwColumns(self.layout, ((THERMOSTAT, dict(THERMOSTAT_DATA)),
+                                        (PLUG, PLUG_DATA)))
+        self.assertEqual(store.diff(self.store), {})
+        store = PwColumns(self.layout, (
+            (THERMOSTAT, dict(THERMOSTAT_DATA, battery=80.0)),
+            (PLUG, PLUG_DATA)))
+        self.assertEqual(store.diff(self.store), {THERMOSTAT: {"battery"}})
+
+    def test_projection(self):
+        """A projected build updates its fields, the others are kept."""
+        projection = {THERMOSTAT: frozenset({"current_temp"}), PLUG: None}
+        store = PwColumns(self.layout, (
+            (THERMOSTAT, {"current_temp": 20.7, "setpoint_temp": None}),
+            (PLUG, dict(PLUG_DATA, relay="off"))),
+                          previous=self.store, projection=projection)
+        self.assertEqual(dict(store[THERMOSTAT]),
+                         dict(THERMOSTAT_DATA, current_temp=20.7))
+        self.assertEqual(store[PLUG]["relay"], "off")
+        self.assertEqual(store.diff(self.store), {
+            THERMOSTAT: {"current_temp"}, PLUG: {"relay"}})
+        # The previous store is left alone
+        self.assertEqual(dict(self.store[THERMOSTAT]), THERMOSTAT_DATA)
+
+    def test_new_layout(self):
+        """A store in a new layout keeps the rows of the devices in both."""
+        layout = slots((PLUG, NEW_PLUG))
+        projection = {PLUG: frozenset({"relay"})}
+        store = PwColumns(layout, (
+            (PLUG, {"relay": "off"}), (NEW_PLUG, PLUG_DATA)),
+                          previous=self.store, projection=projection)
+        self.assertEqual(store.layout, layout)
+        self.assertNotIn(THERMOSTAT, store)
+        self.assertEqual(dict(store[PLUG]), dict(PLUG_DATA, relay="off"))
+        self.assertEqual(dict(store[NEW_PLUG]), PLUG_DATA)
+        self.assertEqual(store.diff(self.store), {
+            PLUG: {"relay"}, NEW_PLUG: set(PLUG_DATA)})
+
+    def test_new_fields(self):
+        """A field not known to the store is kept as an object."""
+        store = PwColumns(self.layout, (
+            (PLUG, dict(PLUG_DATA, firmware="3.1")),))
+        self.assertEqual(store[PLUG]["firmware"], "3.1")
+        self.assertEqual(store.diff(self.store), {
+            THERMOSTAT: set(THERMOSTAT_DATA), PLUG: {"firmware"}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,227 @@
+"""Tests of the gateway client against the recorded domain objects."""
+
+import copy
+import unittest
+import xml.etree.ElementTree as Etree
+from pathlib import Path
+from urllib.parse import quote
+
+from custom_components.adam.gateway import (
+    DOMAIN_OBJECTS, MODIFIED_SINCE, PwGateway)
+
+FIXTURE = (Path(__file__).resolve().parents[1]
+           / "benchmarks" / "fixtures" / "adam.xml")
+
+CONTROLLER = "90986d591dcd426cae3ec3e8111ff730"
+WOONKAMER = "c50f167537524366a5af7aa3942feb1e"
+BADKAMER = "12493538af164a409c6a1c79e38afe1c"
+KOELKAST = "aac7b735042c4832ac9ff33aae4f453b"
+WASMACHINE = "5871317346d045bc9f6b987ef25ee638"
+PLAYSTATION = "21f2b542c49845e6bb416884c55778d6"
+TOM_BADKAMER = "d3da73bde12a47d5a6b8f9dad971f2ec"
+WERKDAGEN = "e7693eb9582644e5b865dba8d4447cf1"
+
+# Later than all modified dates of the fixture
+MODIFIED = "2020-03-01T11:00:00.000+01:00"
+
+
+class FakeResponse:
+    """A streamed response of a fixed body."""
+
+    def __init__(self, body):
+        """Serve a body."""
+        self._body = body
+
+    def iter_content(self, size):
+        """Return the chunks of the body."""
+        return iter([self._body[i:i + size]
+                     for i in range(0, len(self._body), size)])
+
+    def close(self):
+        """Nothing to release."""
+
+    def __enter__(self):
+        """Return the response."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the response."""
+        self.close()
+
+
+def _document(elements):
+    """Return a domain objects document of elements."""
+    return (b"<domain_objects>"
+            + b"".join(Etree.tostring(element) for element in elements)
+            + b"</domain_objects>")
+
+
+def _modified(element, modified=MODIFIED):
+    """Return a copy of an element modified at a date."""
+    element = copy.deepcopy(element)
+    element.find("modified_date").text = modified
+    return element
+
+
+class GatewayTest(unittest.TestCase):
+    """Parsing and merging the domain objects into the model."""
+
+    def setUp(self):
+        """Set up a gateway answering from the fixture."""
+        self.root = Etree.parse(str(FIXTURE)).getroot()
+        self.objects = list(self.root)
+        self.incremental = []
+        self.requests = []
+        self.gateway = PwGateway("smile", "x", "127.0.0.1", 80)
+        self.gateway._request = self._request
+
+    def _request(self, path, method="get", data=None, stream=False):
+        """Answer a request from the objects, or the incremental objects."""
+        self.requests.append("full" if path == DOMAIN_OBJECTS else path)
+        if path == DOMAIN_OBJECTS:
+            return FakeResponse(_document(self.objects))
+        self.assertEqual(
+            path, DOMAIN_OBJECTS + MODIFIED_SINCE.format(quote(
+                self.gateway._modified)))
+        return FakeResponse(_document(self.incremental))
+
+    def _element(self, obj_id):
+        """Return an object of the fixture."""
+        return self.root.find("*[@id='{}']".format(obj_id))
+
+    def _sync(self, incremental=()):
+        """Update the gateway, return the kinds of requests made."""
+        self.incremental = list(incremental)
+        self.requests = []
+        self.gateway.full_update_device()
+        return ["full" if kind == "full" else "incremental"
+                for kind in self.requests]
+
+    def _sync_fields(self, fields):
+        """Sync, then sync the objects again with only these fields."""
+        self._sync()
+        self.gateway.set_fields(fields)
+        self.gateway._synced_at -= 3600
+        self._sync()
+
+    def test_devices(self):
+        """The controller, thermostats (locations) and plugs are found."""
+        self._sync()
+        devices = {(dev["type"], dev["name"])
+                   for dev in self.gateway.get_devices()}
+        self.assertEqual(devices, {
+            ("heater_central", "OpenTherm"),
+            ("thermostat", "Woonkamer"),
+            ("thermostat", "Badkamer"),
+            ("thermostat", "Slaapkamer"),
+            ("plug", "Wasmachine"),
+            ("plug", "Koelkast"),
+            ("plug", "Playstation"),
+        })
+
+    def test_thermostat_data(self):
+        """A location has its setpoint, temperature and schedules."""
+        self._sync()
+        data = self.gateway.get_device_data(WOONKAMER, CONTROLLER, None)
+        self.assertEqual(data["setpoint_temp"], 21.0)
+        self.assertEqual(data["current_temp"], 20.9)
+        self.assertEqual(data["active_preset"], "home")
+        self.assertEqual(data["available_schedules"],
+                         ["Werkdagen", "Weekend & vakantie"])
+        self.assertEqual(data["selected_schedule"], "Werkdagen")
+
+    def test_plug_data(self):
+        """A plug has its relay and power."""
+        self._sync()
+        data = self.gateway.get_device_data(None, None, KOELKAST)
+        self.assertEqual(data["relay"], "on")
+        self.assertEqual(data["electricity_consumed"], 58.4)
+        self.assertEqual(data["electricity_consumed_interval"], 41.0)
+
+    def test_incremental_merge(self):
+        """A modified object replaces its record, the others are kept."""
+        self.assertEqual(self._sync(), ["full"])
+        fingerprint = self.gateway.fingerprint
+        koelkast = _modified(self._element(KOELKAST))
+        koelkast.find("logs/point_log/period/measurement").text = "70.00"
+
+        self.assertEqual(self._sync([koelkast]), ["incremental"])
+        self.assertEqual(self.gateway.get_device_data(
+            None, None, KOELKAST)["electricity_consumed"], 70.0)
+        self.assertEqual(self.gateway.get_device_data(
+            None, None, WASMACHINE)["relay"], "on")
+        self.assertEqual(self.gateway.fingerprint, fingerprint)
+
+    def test_inconsistent_incremental_resyncs(self):
+        """An object referring to an unknown location forces a full sync."""
+        self._sync()
+        tom = _modified(self._element(TOM_BADKAMER))
+        tom.find("location").set("id", "0" * 32)
+        self.assertEqual(self._sync([tom]), ["incremental", "full"])
+
+    def test_wanted_logs_force_full_sync(self):
+        """Logs wanted which weren't parsed before are fetched in full."""
+        self._sync_fields({"setpoint_temp", "relay"})
+        self.assertIsNone(self.gateway.get_device_data(
+            None, None, KOELKAST)["electricity_consumed"])
+        self.assertEqual(self._sync(), ["incremental"])
+
+        self.gateway.set_fields({"setpoint_temp", "electricity_consumed"})
+        self.assertEqual(self._sync(), ["full"])
+        self.assertEqual(self.gateway.get_device_data(
+            None, None, KOELKAST)["electricity_consumed"], 58.4)
+
+    def test_new_object(self):
+        """A new plug changes the fingerprint and has all its logs."""
+        self._sync_fields({"setpoint_temp", "relay"})
+        self.assertIsNone(self.gateway.get_device_data(
+            None, None, KOELKAST)["electricity_consumed"])
+        fingerprint = self.gateway.fingerprint
+        plug = _modified(self._element(KOELKAST))
+        plug.set("id", "f" * 32)
+        plug.find("name").text = "Vriezer"
+
+        self.assertEqual(self._sync([plug]), ["incremental"])
+        self.assertNotEqual(self.gateway.fingerprint, fingerprint)
+        self.assertIn(("plug", "Vriezer"), {
+            (dev["type"], dev["name"]) for dev in self.gateway.get_devices()})
+        self.assertEqual(self.gateway.get_device_data(
+            None, None, "f" * 32)["electricity_consumed"], 58.4)
+
+    def test_removed_object(self):
+        """A full sync drops the objects the gateway no longer has."""
+        self._sync()
+        fingerprint = self.gateway.fingerprint
+        self.objects = [element for element in self.objects
+                        if element.get("id") != PLAYSTATION]
+        self.gateway._synced_at -= 3600
+
+        self.assertEqual(self._sync(), ["full"])
+        self.assertNotEqual(self.gateway.fingerprint, fingerprint)
+        self.assertNotIn("Playstation", {
+            dev["name"] for dev in self.gateway.get_devices()})
+
+    def test_metadata_invalidation(self):
+        """A changed rule drops the cached metadata of its locations only."""
+        self._sync()
+        woonkamer = self.gateway.get_device_data(WOONKAMER, CONTROLLER, None)
+        badkamer = self.gateway.get_device_data(BADKAMER, CONTROLLER, None)
+        self.assertIs(self.gateway.get_device_data(
+            WOONKAMER, CONTROLLER, None)["available_schedules"],
+                      woonkamer["available_schedules"])
+
+        rule = _modified(self._element(WERKDAGEN))
+        rule.find("active").text = "false"
+        self._sync([rule])
+
+        data = self.gateway.get_device_data(WOONKAMER, CONTROLLER, None)
+        self.assertIsNone(data["selected_schedule"])
+        self.assertIsNot(data["available_schedules"],
+                         woonkamer["available_schedules"])
+        self.assertIs(self.gateway.get_device_data(
+            BADKAMER, CONTROLLER, None)["available_schedules"],
+                      badkamer["available_schedules"])
+
+
+if __name__ == "__main__":
+    unittest.main()
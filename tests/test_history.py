@@ -0,0 +1,82 @@
+"""Tests of the ring buffer of the plug readings."""
+
+import unittest
+from datetime import timedelta
+
+from custom_components.adam.history import (
+    HISTORY_SIZE, PwRingBuffer, history_size)
+
+FIELD = "electricity_consumed"
+
+
+class HistoryTest(unittest.TestCase):
+    """Statistics and coverage of the readings within a window."""
+
+    def _buffer(self, readings, size=HISTORY_SIZE):
+        """Return a buffer of (time, value) readings."""
+        history = PwRingBuffer(fields=(FIELD,), size=size)
+        for timestamp, value in readings:
+            history.add(timestamp, {FIELD: value})
+        return history
+
+    def test_empty(self):
+        """Without readings there are no statistics and no coverage."""
+        history = PwRingBuffer()
+        self.assertIsNone(history.statistics(FIELD, 100.0))
+        self.assertFalse(history.covers(100.0))
+
+    def test_readings_hold_until_the_next(self):
+        """The average weighs each reading by the time it held."""
+        history = self._buffer([(0.0, 100.0), (10.0, 200.0)])
+        average, peak, integral = history.statistics(FIELD, 40.0, window=40)
+        self.assertEqual(integral, 100.0 * 10 + 200.0 * 30)
+        self.assertEqual(average, integral / 40)
+        self.assertEqual(peak, 200.0)
+
+    def test_reading_before_the_window(self):
+        """The last reading before the window holds into it."""
+        history = self._buffer([(0.0, 300.0), (50.0, 200.0), (80.0, 50.0)])
+        average, peak, integral = history.statistics(FIELD, 100.0, window=40)
+        self.assertEqual(integral, 200.0 * 20 + 50.0 * 20)
+        self.assertEqual(average, integral / 40)
+        self.assertEqual(peak, 200.0)
+
+    def test_missing_values(self):
+        """A missing value is skipped, None when all are."""
+        history = self._buffer([(0.0, None), (10.0, 60.0)])
+        average, peak, integral = history.statistics(FIELD, 20.0, window=20)
+        self.assertEqual((average, peak, integral), (60.0, 60.0, 600.0))
+        self.assertIsNone(self._buffer([(0.0, None)]).statistics(FIELD, 1.0))
+
+    def test_wraps_around(self):
+        """A full buffer drops its oldest readings."""
+        history = self._buffer(
+            [(float(second), float(second)) for second in range(10)], size=4)
+        self.assertEqual(len(history), 4)
+        average, peak, integral = history.statistics(FIELD, 10.0, window=100)
+        self.assertEqual(peak, 9.0)
+        self.assertEqual(integral, 6.0 + 7.0 + 8.0 + 9.0)
+        self.assertEqual(average, integral / 4)
+
+    def test_covers(self):
+        """The readings cover a window reaching back to the oldest."""
+        history = self._buffer([(100.0, 1.0), (200.0, 2.0)])
+        self.assertTrue(history.covers(160.0, window=60))
+        self.assertFalse(history.covers(159.0, window=60))
+
+    def test_covers_after_wrapping(self):
+        """The oldest reading left decides the coverage of a full buffer."""
+        history = self._buffer(
+            [(float(second), 1.0) for second in range(10)], size=4)
+        self.assertTrue(history.covers(66.0, window=60))
+        self.assertFalse(history.covers(65.0, window=60))
+
+    def test_history_size(self):
+        """The buffer covers the window at the poll interval."""
+        self.assertEqual(history_size(timedelta(seconds=60)), HISTORY_SIZE)
+        self.assertEqual(history_size(timedelta(seconds=10)), 361)
+        self.assertEqual(history_size(timedelta(seconds=7)), 516)
+
+
+if __name__ == "__main__":
+    unittest.main()
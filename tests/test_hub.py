@@ -0,0 +1,165 @@
+"""Tests of the refreshes of a hub, against a gateway of one plug."""
+
+import asyncio
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+
+from custom_components.adam import (
+    ADAM_CONFIG, BACKOFF_MAX, BACKOFF_MIN, FAILURES_BEFORE_OPEN, PwHub,
+    _signal)
+
+PLUG = (None, None, "plug")
+
+
+class FakeGateway:
+    """A gateway of one plug, counting its syncs, which can be held.
+
+    It raises its error, when set.
+    """
+
+    def __init__(self):
+        """Answer right away."""
+        self.syncs = 0
+        self.error = None
+        self.fingerprint = "plug"
+        self.last_sync = None
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def full_update_device(self):
+        """Count a sync, waiting for the release when held."""
+        self.syncs += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+
+    def ping_gateway(self):
+        """Answer, unless failing."""
+        if self.error is not None:
+            raise self.error
+
+    def get_devices(self):
+        """Return the plug."""
+        return [{"type": "plug", "id": "plug", "name": "Koelkast"}]
+
+    def get_device_data(self, dev_id, ctrl_id, plug_id, fields=None):
+        """Return the data of the plug."""
+        return {"relay": "on"}
+
+
+class HubTest(unittest.TestCase):
+    """The refreshes of a hub."""
+
+    def setUp(self):
+        """Set up a hub of the gateway."""
+        self.config_dir = tempfile.TemporaryDirectory()
+        self.loop = asyncio.new_event_loop()
+        self.hass = HomeAssistant(self.loop)
+        self.hass.config.config_dir = self.config_dir.name
+        self.api = FakeGateway()
+        self.hub = PwHub(self.hass, self.api, ADAM_CONFIG(
+            {"host": "127.0.0.1", "password": "x"}))
+
+    def tearDown(self):
+        """Stop Home Assistant."""
+        self.loop.run_until_complete(self.hass.async_stop(force=True))
+        self.loop.close()
+        self.config_dir.cleanup()
+
+    def _run(self, coro):
+        """Run a coroutine in the loop of Home Assistant."""
+        return self.loop.run_until_complete(coro)
+
+    async def _held(self, *calls):
+        """Make the calls while the first refresh is held."""
+        self.api.release.clear()
+        tasks = [self.hass.async_create_task(self.hub.async_refresh())]
+        await self.hass.async_add_executor_job(self.api.started.wait)
+        tasks += [self.hass.async_create_task(call) for call in calls]
+        await asyncio.sleep(0)
+        self.api.release.set()
+        await asyncio.gather(*tasks)
+
+    def test_refresh(self):
+        """A refresh discovers the plug and reads its data."""
+        self._run(self.hub.async_refresh())
+        self.assertEqual(self.api.syncs, 1)
+        self.assertEqual(dict(self.hub.snapshot[PLUG]), {"relay": "on"})
+
+    def test_shared_refresh(self):
+        """Calls during a refresh share it."""
+        self._run(self._held(self.hub.async_refresh(),
+                             self.hub.async_refresh()))
+        self.assertEqual(self.api.syncs, 1)
+
+    def test_fresh_refresh(self):
+        """Fresh calls during a refresh share the next one."""
+        self._run(self._held(self.hub.async_refresh(fresh=True),
+                             self.hub.async_refresh(fresh=True)))
+        self.assertEqual(self.api.syncs, 2)
+        self.assertIsNone(self.hub._next_refresh)
+
+    def test_fresh_refresh_idle(self):
+        """A fresh call without a refresh in flight starts one."""
+        self._run(self.hub.async_refresh(fresh=True))
+        self.assertEqual(self.api.syncs, 1)
+
+    def test_backoff(self):
+        """The delay after failures doubles up to a maximum, jittered."""
+        for failures, delay in ((1, BACKOFF_MIN), (2, BACKOFF_MIN * 2),
+                                (20, BACKOFF_MAX)):
+            self.hub._failures = failures
+            backoff = self.hub._backoff()
+            self.assertGreaterEqual(backoff, delay / 2)
+            self.assertLessEqual(backoff, delay)
+
+    def test_unavailable(self):
+        """Too many failures make the hub unavailable until a probe answers."""
+        self._run(self.hub.async_refresh())
+        signals = []
+        async_dispatcher_connect(self.hass, _signal(PLUG), signals.append)
+        self.api.error = OSError("down")
+        with patch("custom_components.adam.async_call_later") as call_later:
+            for _ in range(FAILURES_BEFORE_OPEN - 1):
+                self._run(self.hub.async_refresh())
+            self.assertTrue(self.hub.available)
+            self.assertEqual(call_later.call_args[0][2],
+                             self.hub.async_refresh)
+
+            self._run(self.hub.async_refresh())
+            self._run(self.hass.async_block_till_done())
+            self.assertFalse(self.hub.available)
+            self.assertEqual(self.hub.stats.failed, FAILURES_BEFORE_OPEN)
+            self.assertEqual(call_later.call_args[0][2], self.hub._async_probe)
+            self.assertEqual(signals, [None])
+
+            self._run(self.hub._async_probe())
+            self.assertEqual(self.hub.stats.failed, FAILURES_BEFORE_OPEN + 1)
+            self.assertEqual(call_later.call_args[0][2], self.hub._async_probe)
+
+            self.api.error = None
+            self._run(self.hub._async_probe())
+            self._run(self.hass.async_block_till_done())
+        self.assertTrue(self.hub.available)
+        self.assertEqual(self.hub._failures, 0)
+        self.assertEqual(signals, [None, None])
+
+    def test_unexpected_error(self):
+        """An unexpected error counts as a failed refresh."""
+        self._run(self.hub.async_refresh())
+        self.api.error = ValueError("bad data")
+        with self.assertLogs("custom_components.adam", "ERROR"):
+            self._run(self.hub.async_refresh())
+        self.assertEqual(self.hub.stats.failed, 1)
+        self.assertIsNone(self.hub._refresh)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Tests of the adaptive interval between the refreshes of a hub."""
+
+import unittest
+from datetime import datetime, timedelta
+
+import homeassistant.util.dt as dt_util
+
+from custom_components.adam import (
+    FAST_SCAN_INTERVAL, FAST_SCAN_PERIOD, STABLE_REFRESHES, PwPollInterval)
+
+SCAN_INTERVAL = timedelta(seconds=60)
+THERMOSTAT = ("loc", "ctrl", None)
+
+SCHEDULED = {"setpoint_temp": 21.0, "selected_schedule": "Werkdagen"}
+
+# Noon, far from any transition learned by the tests
+NOON = datetime(2020, 3, 1, 12, 0, tzinfo=dt_util.UTC)
+
+
+class PollIntervalTest(unittest.TestCase):
+    """The interval follows the commands, hvac changes and schedules."""
+
+    def setUp(self):
+        """Set up an interval in UTC."""
+        self.time_zone = dt_util.DEFAULT_TIME_ZONE
+        dt_util.set_default_time_zone(dt_util.UTC)
+        self.poll = PwPollInterval(SCAN_INTERVAL)
+
+    def tearDown(self):
+        """Restore the time zone."""
+        dt_util.set_default_time_zone(self.time_zone)
+
+    def _update(self, fields, now, force=()):
+        """Learn a change of fields of the thermostat."""
+        snapshot = {THERMOSTAT: SCHEDULED}
+        diff = {THERMOSTAT: set(fields)} if fields else {}
+        self.poll.update(snapshot, snapshot, diff, force, now)
+
+    def test_scan_interval(self):
+        """Without changes the scan interval is used."""
+        self._update((), NOON)
+        self.assertEqual(self.poll.next_interval(NOON), SCAN_INTERVAL)
+
+    def test_boost(self):
+        """After a command the refreshes are fast for a while."""
+        self.poll.boost(NOON)
+        self.assertEqual(self.poll.next_interval(NOON), FAST_SCAN_INTERVAL)
+        self.assertEqual(self.poll.next_interval(NOON + FAST_SCAN_PERIOD),
+                         SCAN_INTERVAL)
+
+    def test_hvac_change_boosts(self):
+        """A changed hvac state boosts, another change doesn't."""
+        self._update({"current_temp"}, NOON)
+        self.assertEqual(self.poll.next_interval(NOON), SCAN_INTERVAL)
+        self._update({"boiler_state"}, NOON)
+        self.assertEqual(self.poll.next_interval(NOON), FAST_SCAN_INTERVAL)
+
+    def test_stable(self):
+        """The interval doubles after stable refreshes, until a boost."""
+        for _ in range(STABLE_REFRESHES):
+            self._update({"current_temp"}, NOON)
+        self.assertEqual(self.poll.next_interval(NOON), SCAN_INTERVAL * 2)
+        self.poll.boost(NOON)
+        later = NOON + FAST_SCAN_PERIOD
+        self.assertEqual(self.poll.next_interval(later), SCAN_INTERVAL)
+
+    def test_schedule_transition(self):
+        """A scheduled setpoint change is polled fast around the next day."""
+        transition = NOON.replace(hour=7)
+        self._update({"setpoint_temp"}, transition)
+        tomorrow = transition + timedelta(days=1)
+        self.assertEqual(self.poll.next_interval(NOON), SCAN_INTERVAL)
+        self.assertEqual(
+            self.poll.next_interval(tomorrow - timedelta(minutes=3)),
+            FAST_SCAN_INTERVAL)
+        self.assertEqual(
+            self.poll.next_interval(tomorrow + timedelta(minutes=2)),
+            FAST_SCAN_INTERVAL)
+        self.assertEqual(
+            self.poll.next_interval(tomorrow + timedelta(minutes=3)),
+            SCAN_INTERVAL)
+
+    def test_command_is_no_transition(self):
+        """A setpoint change of a forced device is no transition."""
+        transition = NOON.replace(hour=7)
+        self._update({"setpoint_temp"}, transition, force={THERMOSTAT})
+        self.assertEqual(
+            self.poll.next_interval(transition + timedelta(days=1)),
+            SCAN_INTERVAL)
+
+
+if __name__ == "__main__":
+    unittest.main()